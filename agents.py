@@ -2,87 +2,130 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from crewai import Agent, LLM
-from crewai_tools import SerperDevTool
-from tools import read_financial_document, analyze_investment, assess_risk
+from functools import lru_cache
+from llm_config import LLM_MODEL, LLM_TEMPERATURE, LLM_STREAM
+
+# Nothing is built at import time, and crewai is only imported on first use, so
+# importing this module is cheap. Celery workers build the LLM, tools and agents
+# once per process (see celery_tasks.warm_worker) and reuse them across tasks.
 
 # --- LLM setup ---
-llm = LLM(
-    model="gpt-4",
-    temperature=0.1,
-)
+@lru_cache(maxsize=None)
+def get_llm():
+    # Identical prompts are answered from the response cache (see llm_cache.py)
+    from llm_cache import CachedLLM
+    return CachedLLM(
+        model=LLM_MODEL,
+        temperature=LLM_TEMPERATURE,
+        stream=LLM_STREAM,  # tokens are relayed to /status/{task_id}/events
+    )
 
 # Search tool
-search_tool = SerperDevTool()
+@lru_cache(maxsize=None)
+def get_search_tool():
+    from crewai_tools import SerperDevTool
+    return SerperDevTool()
 
 # --- Agents ---
 
-financial_analyst = Agent(
-    role="Senior Financial Analyst",
-    goal="Provide accurate and comprehensive financial analysis based on the provided documents for: {query}",
-    verbose=True,
-    memory=True,
-    backstory=(
-        "You are an experienced financial analyst with over 15 years in the industry. "
-        "You specialize in analyzing financial documents, identifying key metrics, trends, and risks. "
-        "You provide well-researched, data-driven insights and investment recommendations. "
-        "You always ensure your analysis is based on factual information from the documents provided. "
-        "You follow regulatory compliance and ethical standards in all your recommendations. "
-        "You clearly distinguish between facts from the documents and your professional opinions."
-    ),
-    tools=[read_financial_document, analyze_investment, search_tool],
-    llm=llm,
-    max_iter=3,
-    allow_delegation=False
-)
+def build_agents() -> dict:
+    """Create the agents around the shared LLM and search tool
+
+    Agents hold per-run state, so each crew set checked out by a worker gets its own.
+    """
+    from crewai import Agent
+    from tools import read_financial_document, search_financial_document, extract_financial_metrics, analyze_investment, assess_risk
+    llm = get_llm()
+    search_tool = get_search_tool()
+
+    financial_analyst = Agent(
+        role="Senior Financial Analyst",
+        goal="Provide accurate and comprehensive financial analysis based on the provided documents for: {query}",
+        verbose=True,
+        memory=True,
+        backstory=(
+            "You are an experienced financial analyst with over 15 years in the industry. "
+            "You specialize in analyzing financial documents, identifying key metrics, trends, and risks. "
+            "You provide well-researched, data-driven insights and investment recommendations. "
+            "You always ensure your analysis is based on factual information from the documents provided. "
+            "You follow regulatory compliance and ethical standards in all your recommendations. "
+            "You clearly distinguish between facts from the documents and your professional opinions."
+        ),
+        tools=[search_financial_document, extract_financial_metrics, analyze_investment, search_tool],
+        llm=llm,
+        max_iter=3,
+        allow_delegation=False
+    )
+
+    verifier = Agent(
+        role="Financial Document Verifier",
+        goal="Verify and validate the authenticity and completeness of financial documents",
+        verbose=True,
+        memory=True,
+        backstory=(
+            "You are a meticulous document verification specialist with expertise in financial compliance. "
+            "You carefully review financial documents for accuracy, completeness, and regulatory compliance. "
+            "You identify any inconsistencies, missing information, or potential issues in the documentation. "
+            "You ensure all financial data meets industry standards and regulatory requirements."
+        ),
+        tools=[read_financial_document],
+        llm=llm,
+        max_iter=2,
+        allow_delegation=False
+    )
+
+    investment_advisor = Agent(
+        role="Investment Advisor",
+        goal="Provide sound investment advice based on financial analysis and market conditions",
+        verbose=True,
+        backstory=(
+            "You are a certified investment advisor with extensive experience in portfolio management. "
+            "You provide personalized investment recommendations based on thorough financial analysis. "
+            "You consider risk tolerance, investment objectives, and market conditions in your advice. "
+            "You always disclose potential risks and ensure recommendations are suitable for the client. "
+            "You maintain the highest ethical standards and regulatory compliance in all recommendations."
+        ),
+        tools=[analyze_investment, search_tool],
+        llm=llm,
+        max_iter=2,
+        allow_delegation=False
+    )
+
+    risk_assessor = Agent(
+        role="Risk Assessment Specialist",
+        goal="Conduct comprehensive risk analysis and provide risk mitigation strategies",
+        verbose=True,
+        backstory=(
+            "You are a risk management expert with deep knowledge of financial markets and risk assessment. "
+            "You identify, quantify, and analyze various types of financial risks. "
+            "You develop practical risk mitigation strategies and monitor risk exposure. "
+            "You use established risk models and industry best practices in your assessments. "
+            "You provide clear, actionable risk management recommendations."
+        ),
+        tools=[assess_risk, search_tool],
+        llm=llm,
+        max_iter=2,
+        allow_delegation=False
+    )
 
-verifier = Agent(
-    role="Financial Document Verifier",
-    goal="Verify and validate the authenticity and completeness of financial documents",
-    verbose=True,
-    memory=True,
-    backstory=(
-        "You are a meticulous document verification specialist with expertise in financial compliance. "
-        "You carefully review financial documents for accuracy, completeness, and regulatory compliance. "
-        "You identify any inconsistencies, missing information, or potential issues in the documentation. "
-        "You ensure all financial data meets industry standards and regulatory requirements."
-    ),
-    tools=[read_financial_document],
-    llm=llm,
-    max_iter=2,
-    allow_delegation=False
-)
+    return {
+        "financial_analyst": financial_analyst,
+        "verifier": verifier,
+        "investment_advisor": investment_advisor,
+        "risk_assessor": risk_assessor,
+    }
 
-investment_advisor = Agent(
-    role="Investment Advisor",
-    goal="Provide sound investment advice based on financial analysis and market conditions",
-    verbose=True,
-    backstory=(
-        "You are a certified investment advisor with extensive experience in portfolio management. "
-        "You provide personalized investment recommendations based on thorough financial analysis. "
-        "You consider risk tolerance, investment objectives, and market conditions in your advice. "
-        "You always disclose potential risks and ensure recommendations are suitable for the client. "
-        "You maintain the highest ethical standards and regulatory compliance in all recommendations."
-    ),
-    tools=[analyze_investment, search_tool],
-    llm=llm,
-    max_iter=2,
-    allow_delegation=False
-)
+@lru_cache(maxsize=None)
+def get_agents() -> dict:
+    """The default set of agents for this process"""
+    return build_agents()
 
-risk_assessor = Agent(
-    role="Risk Assessment Specialist",
-    goal="Conduct comprehensive risk analysis and provide risk mitigation strategies",
-    verbose=True,
-    backstory=(
-        "You are a risk management expert with deep knowledge of financial markets and risk assessment. "
-        "You identify, quantify, and analyze various types of financial risks. "
-        "You develop practical risk mitigation strategies and monitor risk exposure. "
-        "You use established risk models and industry best practices in your assessments. "
-        "You provide clear, actionable risk management recommendations."
-    ),
-    tools=[assess_risk, search_tool],
-    llm=llm,
-    max_iter=2,
-    allow_delegation=False
-)
\ No newline at end of file
+def __getattr__(name):
+    # Keeps `from agents import financial_analyst` working without building at import time
+    if name == "llm":
+        return get_llm()
+    if name == "search_tool":
+        return get_search_tool()
+    if name in ("financial_analyst", "verifier", "investment_advisor", "risk_assessor"):
+        return get_agents()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
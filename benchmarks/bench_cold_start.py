@@ -0,0 +1,78 @@
+"""Measure API cold start: import time and time to the first `/` response.
+
+Each run starts a fresh interpreter. "import main" is what uvicorn loads;
+"import main+celery_tasks" adds the agent stack, which is what the API paid
+before it enqueued tasks by name. That row needs crewai installed and is
+skipped otherwise.
+
+Usage:
+    python benchmarks/bench_cold_start.py --runs 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-benchmark"),
+           SERPER_API_KEY=os.getenv("SERPER_API_KEY", "benchmark"))
+
+
+def import_seconds(modules: str) -> float:
+    code = f"import time; start = time.perf_counter(); import {modules}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=ENV,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip())
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_response_seconds(timeout: float = 60.0) -> float:
+    """Start uvicorn and poll / until it answers"""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=ROOT, env=ENV, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("API did not answer within the timeout")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def report(name: str, samples: list):
+    print(f"{name:>24} {statistics.median(samples) * 1000:>10.0f} {min(samples) * 1000:>10.0f} {max(samples) * 1000:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'':>24} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    report("import main", [import_seconds("main") for _ in range(args.runs)])
+    try:
+        report("import main+celery_tasks", [import_seconds("main, celery_tasks") for _ in range(args.runs)])
+    except subprocess.CalledProcessError:
+        print(f"{'import main+celery_tasks':>24} skipped (agent stack not importable)")
+    report("first / response", [first_response_seconds() for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Measure incremental re-analysis of a revised filing against a full re-read.
+
+A document of --pages pages is "analyzed" (extracted into the cache), then a
+revision with --changed edited pages is processed two ways:
+
+  full         extract every page of the revision
+  incremental  fingerprint the revision's pages, align them with the earlier
+               version and extract only the changed pages
+
+Also compares the document text an LLM would be given: the whole revision
+versus the before/after text of the changed sections only, clipped as in
+the summary prompts. No LLM is called.
+
+Usage:
+    python benchmarks/bench_incremental.py --pages 200 --changed 4
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_pdf import page_lines, write_pdf
+
+HEADINGS = ["Revenue Overview", "Operating Expenses", "Balance Sheet", "Cash Flow", "Risk Factors", "Outlook"]
+
+
+def document(num_pages: int, changed: set) -> list:
+    rng = random.Random(0)
+    pages = []
+    for number in range(num_pages):
+        lines = page_lines(number, rng)
+        if number % 10 == 0:
+            lines.insert(0, HEADINGS[(number // 10) % len(HEADINGS)])
+        if number in changed:
+            lines.append("Net income $12,345 $23,456 $34,567 restated")
+        pages.append(lines)
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--changed", type=int, default=4, help="pages edited in the revision")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-incremental-")
+    os.environ["EXTRACTION_CACHE_DIR"] = os.path.join(workdir, "cache")
+    from extraction_cache import extraction_cache, document_hash
+    from incremental import (SECTION_PROMPT_CHARS, page_fingerprints, align_pages, assemble_pages, document_sections,
+                             key_sections, diff_sections)
+    from pdf_extractor import extract_pages, iter_document_pages
+
+    changed = set(random.Random(1).sample(range(args.pages), args.changed))
+    original = write_pdf(os.path.join(workdir, "original.pdf"), 0, pages=document(args.pages, set()))
+    revised = write_pdf(os.path.join(workdir, "revised.pdf"), 0, pages=document(args.pages, changed))
+    old_pages = list(iter_document_pages(original))
+    old_hashes = page_fingerprints(original)
+
+    def incremental():
+        extraction_cache.clear()
+        alignment = align_pages(old_hashes, page_fingerprints(revised))
+        return assemble_pages(revised, old_pages, alignment, args.pages)
+
+    full_seconds, incremental_seconds = [], []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        extract_pages(revised, workers=1)
+        full_seconds.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        new_pages = incremental()
+        incremental_seconds.append(time.perf_counter() - start)
+
+    old_sections = key_sections(document_sections(old_pages))
+    new_sections = key_sections(document_sections(new_pages), old_sections)
+    revised_keys = diff_sections(old_sections, new_sections)["modified"]
+    full_chars = sum(len(page) for page in new_pages)
+    incremental_chars = sum(
+        min(len(sections[key]["text"]), SECTION_PROMPT_CHARS)
+        for key in revised_keys for sections in (old_sections, new_sections)
+    )
+
+    print(f"{args.pages} pages, {args.changed} changed, revised sections: {', '.join(revised_keys)}")
+    print(f"\n{'':>12} {'median ms':>10} {'doc chars to LLM':>18}")
+    print(f"{'full':>12} {statistics.median(full_seconds) * 1000:>10.1f} {full_chars:>18}")
+    print(f"{'incremental':>12} {statistics.median(incremental_seconds) * 1000:>10.1f} {incremental_chars:>18}")
+    print(f"\nspeed-up: {statistics.median(full_seconds) / statistics.median(incremental_seconds):.1f}x  "
+          f"text reduction: {full_chars / max(1, incremental_chars):.1f}x  "
+          f"(revision hash {document_hash(revised)[:12]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Compare the single-pass keyword scan against the original per-keyword checks.
+
+Runs both analysis tools' indicator logic over the same synthetic report text.
+A single call measures the scan itself; --calls repeats the tool calls the way
+several agents (and retries within one agent) do for one document, where the
+tools reuse the memoized scan instead of rescanning.
+
+Usage:
+    python benchmarks/bench_keyword_scan.py --pages 200 1000 3000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_scanner import document_scanner, FINANCIAL_TERMS, RISK_TERMS
+from synthetic_pdf import page_lines, PROSE
+
+_REPEATED_SPACES = re.compile(r"  +")
+_DIGIT = re.compile(r"\d")
+
+
+def original_tools(text: str):
+    """analyze_investment and assess_risk as they were before the shared scanner"""
+    processed_data = text.strip()
+    while "  " in processed_data:
+        processed_data = processed_data.replace("  ", " ")
+    investment = {
+        "data_length": len(processed_data),
+        "contains_numbers": any(char.isdigit() for char in processed_data),
+        "contains_financial_keywords": any(keyword in processed_data.lower() for keyword in FINANCIAL_TERMS),
+    }
+
+    processed_data = text.strip()
+    risk = {
+        "debt_mentioned": "debt" in processed_data.lower() or "liability" in processed_data.lower(),
+        "loss_mentioned": "loss" in processed_data.lower() or "deficit" in processed_data.lower(),
+        "cash_flow_mentioned": "cash flow" in processed_data.lower(),
+        "risk_keywords_found": [keyword for keyword in ["risk", "uncertainty", "volatile", "fluctuation"]
+                                if keyword in processed_data.lower()],
+    }
+    return investment, risk
+
+
+def scan_profile(text: str) -> dict:
+    """One pass that also yields counts and positions for every term"""
+    text = text.strip()
+    runs = _REPEATED_SPACES.findall(text)
+    profile = document_scanner.scan(text)
+    profile["data_length"] = len(text) - sum(map(len, runs)) + len(runs)
+    profile["contains_numbers"] = _DIGIT.search(text) is not None
+    return profile
+
+
+def scanner_tools(text: str, profile: dict = None):
+    profile = profile or scan_profile(text)
+    counts = profile["counts"]
+    investment = {
+        "data_length": profile["data_length"],
+        "contains_numbers": profile["contains_numbers"],
+        "contains_financial_keywords": any(counts[keyword] for keyword in FINANCIAL_TERMS),
+    }
+    risk = {
+        "debt_mentioned": bool(counts["debt"] or counts["liability"]),
+        "loss_mentioned": bool(counts["loss"] or counts["deficit"]),
+        "cash_flow_mentioned": bool(counts["cash flow"]),
+        "risk_keywords_found": [keyword for keyword in ["risk", "uncertainty", "volatile", "fluctuation"]
+                                if counts[keyword]],
+    }
+    return investment, risk
+
+
+def original_calls(text: str, calls: int):
+    for _ in range(calls):
+        original_tools(text)
+
+
+def scanner_calls(text: str, calls: int):
+    profile = scan_profile(text)
+    for _ in range(calls):
+        scanner_tools(text, profile)
+
+
+def synthetic_text(num_pages: int, layout: str, column_padding: int) -> str:
+    """Report text shaped like pdf extraction output
+
+    "tables" pads financial table columns with runs of spaces; "narrative" is
+    prose only, like risk-factor and MD&A sections, with no figures at all.
+    """
+    rng = random.Random(num_pages)
+    padding = " " * column_padding
+    lines = []
+    for page in range(num_pages):
+        if layout == "narrative":
+            lines.extend(rng.choice(PROSE) for _ in range(40))
+        else:
+            lines.extend(line.replace(" $", padding + "$") for line in page_lines(page, rng))
+    return "\n".join(lines)
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 1000, 3000])
+    parser.add_argument("--padding", type=int, default=24, help="spaces between table columns")
+    parser.add_argument("--calls", type=int, default=4, help="tool calls per document")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'layout':>10} {'pages':>6} {'MB':>6} {'orig 1x s':>10} {'scan 1x s':>10} "
+          f"{f'orig {args.calls}x s':>10} {f'scan {args.calls}x s':>10} {'speedup':>8}")
+    for layout in ("tables", "narrative"):
+        for num_pages in args.pages:
+            text = synthetic_text(num_pages, layout, args.padding)
+            assert original_tools(text) == scanner_tools(text)
+            original = best_of(lambda: original_calls(text, 1), args.repeat)
+            scanner = best_of(lambda: scanner_calls(text, 1), args.repeat)
+            original_n = best_of(lambda: original_calls(text, args.calls), args.repeat)
+            scanner_n = best_of(lambda: scanner_calls(text, args.calls), args.repeat)
+            print(f"{layout:>10} {num_pages:>6} {len(text) / 1e6:>6.1f} {original:>10.3f} {scanner:>10.3f} "
+                  f"{original_n:>10.3f} {scanner_n:>10.3f} {original_n / scanner_n:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compare page-sharded PDF extraction against the original serial loop.
+
+Usage:
+    python benchmarks/bench_pdf_extraction.py --pages 100 300 600 --workers 2 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypdf import PdfReader
+
+import pdf_extractor
+from synthetic_pdf import write_pdf
+
+
+def serial_loop(path: str) -> str:
+    """The extraction loop read_financial_document used before sharding"""
+    full_report = ""
+    with open(path, "rb") as file:
+        pdf_reader = PdfReader(file)
+        for page_num in range(len(pdf_reader.pages)):
+            content = pdf_reader.pages[page_num].extract_text()
+            while "\n\n" in content:
+                content = content.replace("\n\n", "\n")
+            full_report += content + "\n"
+    return full_report.strip()
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 300, 600])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Benchmark the sharding itself, not the small-document cut-off, with one
+    # pool large enough for every --workers value
+    pdf_extractor.PDF_PARALLEL_MIN_PAGES = 0
+    pdf_extractor.PDF_EXTRACTION_WORKERS = max(args.workers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'pages':>6} {'mode':>12} {'seconds':>9} {'pages/s':>9} {'speedup':>8}")
+        for num_pages in args.pages:
+            path = write_pdf(os.path.join(tmp, f"synthetic_{num_pages}.pdf"), num_pages)
+            baseline = best_of(lambda: serial_loop(path), args.repeat)
+            print(f"{num_pages:>6} {'serial loop':>12} {baseline:>9.3f} {num_pages / baseline:>9.1f} {1.0:>7.2f}x")
+
+            for workers in sorted(set(args.workers)):
+                # Warm the pool so worker start-up is not billed to the first run
+                pdf_extractor.extract_pages(path, workers=workers)
+                elapsed = best_of(lambda: pdf_extractor.extract_pages(path, workers=workers), args.repeat)
+                label = f"{workers} workers"
+                print(f"{num_pages:>6} {label:>12} {elapsed:>9.3f} {num_pages / elapsed:>9.1f} {baseline / elapsed:>7.2f}x")
+
+    pdf_extractor.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Measure worker startup and per-task crew overhead, cold versus warm.
+
+Cold is what analyze_document_task did before: build a new LLM, search tool,
+agents and Crew for every task. Warm is the worker_process_init path: build
+once, then only reset the reused crew before each kickoff. No LLM calls are
+made; the numbers are the setup cost paid around each analysis.
+
+Dummy API keys are set when none are configured, since building the clients
+does not contact the providers.
+
+Usage:
+    python benchmarks/bench_worker_startup.py --tasks 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("SERPER_API_KEY", "benchmark")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=50, help="simulated tasks per mode")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    import agents
+    import celery_tasks
+    import_seconds = time.perf_counter() - start
+    print(f"imports (crewai, agents, task, celery_tasks): {import_seconds * 1000:.0f} ms")
+
+    def cold_task():
+        # Fresh clients and agents, as when they were built per import and per task
+        agents.get_llm.cache_clear()
+        agents.get_search_tool.cache_clear()
+        celery_tasks.build_crews()
+
+    warm_start = timed(lambda: celery_tasks.warm_worker())
+    print(f"worker_process_init warm-up: {warm_start * 1000:.1f} ms (paid once per process)")
+
+    def warm_task():
+        with celery_tasks.checkout_crews():
+            pass
+
+    cold = [timed(cold_task) for _ in range(args.tasks)]
+    warm = [timed(warm_task) for _ in range(args.tasks)]
+
+    print(f"\n{'mode':>6} {'mean ms':>10} {'p95 ms':>10} {'total ms':>10}")
+    for name, samples in (("cold", cold), ("warm", warm)):
+        samples = sorted(samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{name:>6} {statistics.mean(samples) * 1000:>10.3f} {p95 * 1000:>10.3f} {sum(samples) * 1000:>10.1f}")
+    print(f"\nper-task saving: {(statistics.mean(cold) - statistics.mean(warm)) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""End-to-end load test: POST /analyze -> Celery -> crew -> result store -> DB.
+
+Runs offline in one process. The API is driven through an in-process ASGI
+client; a Celery worker with a thread pool runs in a background thread against
+the in-memory broker (or a local Redis with --redis-url); the GPT-4 LLM and
+SerperDevTool are swapped for the stand-ins in stub_llm.py. Each request
+uploads a synthetic PDF with a page count taken in turn from --pages, and
+`--clients` clients each submit and wait for one analysis at a time.
+
+Reported:
+  - completed analyses per second
+  - p50/p95/p99 per stage (from the analysis_stage_seconds observations), plus
+    the API's /analyze response time and end-to-end time (created -> completed)
+  - worker utilization: busy task time / (wall time x worker threads)
+  - resident memory at the start, peak and end
+
+Without --redis-url the Redis-backed extras (events, task locks, rate limits,
+queue statistics) fail open, as they do in production when Redis is down.
+Save a run with --json and pass it as --baseline to a later run to fail
+(exit code 1) when throughput drops or end-to-end p95 grows by more than
+--max-regression.
+
+Usage:
+    python benchmarks/load_test.py --requests 40 --clients 8 --workers 8 --pages 2,10,40
+    python benchmarks/load_test.py --json baseline.json
+    python benchmarks/load_test.py --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TERMINAL_STATUSES = ("completed", "failed")
+STATUS_POLL_SECONDS = 0.05
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def configure_environment(workdir: str, redis_url: str = None):
+    """Point every store at `workdir` and turn off what would skew the numbers"""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "RESULT_STORE_BACKEND": "local",
+        "RESULT_STORE_DIR": os.path.join(workdir, "results"),
+        "EXTRACTION_CACHE_DIR": os.path.join(workdir, "extraction"),
+        "RETRIEVAL_INDEX_DIR": os.path.join(workdir, "retrieval"),
+        "LLM_CACHE_BACKEND": "none",
+        "RATE_LIMIT_ENABLED": "false",
+        "TRACING_ENABLED": "false",
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-benchmark"),
+        "SERPER_API_KEY": os.getenv("SERPER_API_KEY", "benchmark"),
+    })
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    if redis_url:
+        os.environ["REDIS_URL"] = redis_url
+
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+class StageSamples:
+    """Stands in for the stage histogram: keeps every observation and forwards it"""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.samples = {}
+
+    def labels(self, stage: str):
+        return _RecordingStage(self.histogram.labels(stage), self.samples.setdefault(stage, []))
+
+    def record(self, stage: str, seconds: float):
+        self.samples.setdefault(stage, []).append(seconds)
+
+
+class _RecordingStage:
+    def __init__(self, child, samples: list):
+        self.child = child
+        self.samples = samples
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self.child.observe(seconds)
+
+
+class WorkerUsage:
+    """Busy time of the worker threads, from the task signals"""
+
+    def __init__(self):
+        self.busy_seconds = 0.0
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def connect(self):
+        from celery.signals import task_prerun, task_postrun
+        task_prerun.connect(self.on_prerun, weak=False)
+        task_postrun.connect(self.on_postrun, weak=False)
+
+    def on_prerun(self, task_id=None, **kwargs):
+        self._started[task_id] = time.perf_counter()
+
+    def on_postrun(self, task_id=None, **kwargs):
+        started = self._started.pop(task_id, None)
+        if started is not None:
+            with self._lock:
+                self.busy_seconds += time.perf_counter() - started
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.start_bytes = self.peak_bytes = rss_bytes()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, rss_bytes())
+
+    def stop(self) -> int:
+        self._done.set()
+        self.join()
+        end = rss_bytes()
+        self.peak_bytes = max(self.peak_bytes, end)
+        return end
+
+
+def install_stubs(args):
+    """Swap the agents' LLM and search tool before the worker builds any crews"""
+    import agents
+    from stub_llm import StubLLM, StubSearchTool
+    llm = StubLLM(latency=args.llm_latency, jitter=args.llm_jitter, answer_tokens=args.answer_tokens)
+    search_tool = StubSearchTool(latency=args.search_latency)
+    agents.get_llm = lambda: llm
+    agents.get_search_tool = lambda: search_tool
+
+
+async def run_clients(app, args, pdfs: dict, stages: StageSamples) -> list:
+    """Each client submits an analysis and polls /status until it finishes"""
+    import httpx
+    page_counts = list(pdfs)
+    next_request = iter(range(args.requests))
+    outcomes = []
+
+    async def client(http):
+        for number in next_request:
+            pages = page_counts[number % len(page_counts)]
+            start = time.perf_counter()
+            response = await http.post(
+                "/analyze",
+                files={"file": (f"report_{number}.pdf", pdfs[pages], "application/pdf")},
+                data={"query": f"Assess revenue quality and risks ({number})", "mode": args.mode, "force": "true"},
+            )
+            stages.record("api_analyze", time.perf_counter() - start)
+            response.raise_for_status()
+            task_id = response.json()["task_id"]
+            while True:
+                status = (await http.get(f"/status/{task_id}")).json()["status"]
+                if status in TERMINAL_STATUSES:
+                    break
+                await asyncio.sleep(STATUS_POLL_SECONDS)
+            outcomes.append((task_id, status))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as http:
+        await asyncio.gather(*(client(http) for _ in range(args.clients)))
+    return outcomes
+
+
+def end_to_end_seconds(task_ids: list) -> list:
+    from database.models import SessionLocal, AnalysisResult
+    db = SessionLocal()
+    try:
+        rows = db.query(AnalysisResult).filter(AnalysisResult.id.in_(task_ids)).all()
+        return [(row.completed_at - row.created_at).total_seconds() for row in rows if row.completed_at]
+    finally:
+        db.close()
+
+
+def run(args) -> dict:
+    import metrics
+    stages = StageSamples(metrics.STAGE_SECONDS)
+    metrics.STAGE_SECONDS = stages  # before anything imports it by name
+
+    install_stubs(args)
+    import main
+    import celery_tasks
+    from celery.contrib.testing.worker import start_worker
+    from celery_app import celery_app, QUEUES
+    from database.models import init_db
+    from synthetic_pdf import build_pdf
+
+    if not args.redis_url:
+        # Queue statistics normally live next to the broker; keep them on REDIS_URL
+        import redis
+        import queue_stats
+        from celery_app import REDIS_URL
+        queue_stats._sync_client = redis.Redis.from_url(REDIS_URL)
+        # The in-memory transport polls its queues; the default 1 s interval would dominate queue wait.
+        # Its worker loop also only sends late acks between 2 s polls, so a prefetch limit the
+        # clients can fill would stall consumption until then.
+        celery_app.conf.update(broker_url="memory://", result_backend="cache+memory://",
+                               broker_transport_options={"polling_interval": 0.01},
+                               worker_prefetch_multiplier=-(-args.clients // args.workers) + 1)
+    init_db()
+    pdfs = {pages: build_pdf(pages, seed=pages) for pages in args.pages}
+
+    usage = WorkerUsage()
+    usage.connect()
+    memory = MemorySampler()
+    memory.start()
+    with start_worker(celery_app, pool="threads", concurrency=args.workers, perform_ping_check=False,
+                      queues=list(QUEUES), loglevel="WARNING", shutdown_timeout=60):
+        start = time.perf_counter()
+        outcomes = asyncio.run(run_clients(main.app, args, pdfs, stages))
+        wall = time.perf_counter() - start
+    end_bytes = memory.stop()
+
+    completed = [task_id for task_id, status in outcomes if status == "completed"]
+    stages.samples["end_to_end"] = end_to_end_seconds(completed)
+    return {
+        "config": {name: value for name, value in vars(args).items() if name not in ("json", "baseline")},
+        "requests": len(outcomes),
+        "completed": len(completed),
+        "failed": len(outcomes) - len(completed),
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(completed) / wall, 3),
+        "worker_utilization": round(usage.busy_seconds / (wall * args.workers), 4),
+        "memory_mb": {
+            "start": round(memory.start_bytes / 2**20, 1),
+            "peak": round(memory.peak_bytes / 2**20, 1),
+            "end": round(end_bytes / 2**20, 1),
+            "max_rss": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "stages": {
+            stage: {
+                "count": len(samples),
+                "p50": round(percentile(samples, 0.50), 4),
+                "p95": round(percentile(samples, 0.95), 4),
+                "p99": round(percentile(samples, 0.99), 4),
+            }
+            for stage, samples in sorted(stages.samples.items()) if samples
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"requests: {report['requests']}  completed: {report['completed']}  failed: {report['failed']}  "
+          f"wall: {report['wall_seconds']:.2f} s")
+    print(f"throughput: {report['requests_per_second']:.2f} analyses/s  "
+          f"worker utilization: {report['worker_utilization'] * 100:.1f}%")
+    memory = report["memory_mb"]
+    print(f"memory (MB): start {memory['start']}  peak {memory['peak']}  end {memory['end']}")
+    print(f"\n{'stage':>16} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for stage, summary in report["stages"].items():
+        print(f"{stage:>16} {summary['count']:>6} {summary['p50'] * 1000:>10.1f} "
+              f"{summary['p95'] * 1000:>10.1f} {summary['p99'] * 1000:>10.1f}")
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list:
+    problems = []
+    if report["requests_per_second"] < baseline["requests_per_second"] * (1 - tolerance):
+        problems.append(f"throughput {report['requests_per_second']} < baseline {baseline['requests_per_second']}")
+    current = report["stages"].get("end_to_end", {}).get("p95")
+    previous = baseline["stages"].get("end_to_end", {}).get("p95")
+    if current and previous and current > previous * (1 + tolerance):
+        problems.append(f"end-to-end p95 {current} s > baseline {previous} s")
+    if report["failed"] > baseline["failed"]:
+        problems.append(f"{report['failed']} failed analyses, baseline had {baseline['failed']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--workers", type=int, default=8, help="worker threads")
+    parser.add_argument("--pages", type=lambda value: [int(n) for n in value.split(",")], default=[2, 10, 40],
+                        help="comma-separated page counts of the synthetic PDFs")
+    parser.add_argument("--mode", choices=("standard", "full"), default="standard")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="mean seconds per LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="standard deviation of the LLM latency")
+    parser.add_argument("--answer-tokens", type=int, default=400, help="words in each final answer")
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--redis-url", help="use this Redis as broker (and for events, locks, ...) instead of memory://")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="tolerated relative slowdown")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    configure_environment(workdir, args.redis_url)
+    try:
+        report = run(args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = regressions(report, json.load(f), args.max_regression)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
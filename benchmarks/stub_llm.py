@@ -0,0 +1,93 @@
+"""Deterministic local stand-ins for the GPT-4 LLM and SerperDevTool.
+
+The stub LLM answers in the ReAct format CrewAI agents parse. On an agent's
+first turn it calls the first document tool offered in the prompt with the
+uploaded file's path, so the real PDF extraction and retrieval code runs; on
+the next turn it gives a final answer. Replies depend only on the prompt, and
+latency is drawn from a normal distribution seeded by the prompt, so runs are
+reproducible without network access.
+"""
+import hashlib
+import json
+import random
+import re
+import time
+
+from crewai import BaseLLM
+from crewai.tools import BaseTool
+
+from metrics import stage_timer
+
+# Tried in this order on an agent's first turn, when the agent has the tool
+DOCUMENT_TOOLS = ("read_financial_document", "search_financial_document", "extract_financial_metrics")
+
+_UPLOAD_PATH = re.compile(r"[\w./\\-]*financial_document_[0-9a-f\-]{36}\.pdf")
+_TOOL_NAME = re.compile(r"Tool Name: ([\w ]+)")
+
+FINAL_ANSWER_WORDS = (
+    "revenue", "margin", "cash", "flow", "liquidity", "leverage", "growth", "risk",
+    "guidance", "capital", "expenditure", "earnings", "outlook", "debt", "equity",
+)
+
+
+def _prompt_text(messages) -> str:
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(message.get("content") or "") for message in messages)
+
+
+class StubLLM(BaseLLM):
+    """Answers after `latency` ± `jitter` seconds with about `answer_tokens` tokens"""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.1, answer_tokens: int = 400):
+        super().__init__(model="stub-llm", temperature=0)
+        self.latency = latency
+        self.jitter = jitter
+        self.answer_tokens = answer_tokens
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        prompt = _prompt_text(messages)
+        seed = int.from_bytes(hashlib.sha256(prompt.encode()).digest()[:8], "big")
+        rng = random.Random(seed)
+        with stage_timer("llm_call"):
+            time.sleep(max(0.0, rng.gauss(self.latency, self.jitter)))
+
+        action = None if "Observation:" in prompt else self._first_action(prompt)
+        if action:
+            tool, path = action
+            return f"Thought: I should read the document first.\nAction: {tool}\nAction Input: {json.dumps({'path': path})}"
+        words = " ".join(rng.choice(FINAL_ANSWER_WORDS) for _ in range(self.answer_tokens))
+        return f"Thought: I now know the final answer\nFinal Answer: ## Analysis\n\n{words}"
+
+    @staticmethod
+    def _first_action(prompt: str):
+        path = _UPLOAD_PATH.search(prompt)
+        offered = {name.strip() for name in _TOOL_NAME.findall(prompt)}
+        for tool in DOCUMENT_TOOLS:
+            if path and tool in offered:
+                return tool, path.group(0)
+        return None
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return True
+
+    def get_context_window_size(self) -> int:
+        return 8192
+
+
+class StubSearchTool(BaseTool):
+    """Canned web search results after a fixed delay"""
+
+    name: str = "Search the internet"
+    description: str = "Search the internet for recent market news about a company."
+    latency: float = 0.2
+
+    def _run(self, search_query: str) -> str:
+        time.sleep(self.latency)
+        return json.dumps({"organic": [
+            {"title": f"{search_query} - quarterly results", "snippet": "Revenue rose on higher deliveries."},
+            {"title": f"{search_query} - analyst notes", "snippet": "Margins expected to stabilise next year."},
+        ]})
@@ -0,0 +1,91 @@
+"""Generate synthetic multi-page financial PDFs for the benchmarks.
+
+Pages are written as plain PDF text objects (Helvetica) so pypdf has real
+content streams to parse, without needing a PDF authoring library.
+"""
+import random
+
+LINE_ITEMS = [
+    "Total revenues", "Cost of revenues", "Gross profit", "Operating expenses",
+    "Income from operations", "Net income", "Total assets", "Total liabilities",
+    "Cash and cash equivalents", "Operating cash flow", "Capital expenditures",
+    "Free cash flow", "Long-term debt", "Total stockholders equity",
+]
+
+PROSE = [
+    "Revenue growth was driven by higher deliveries and improved pricing.",
+    "Risk factors include supply chain uncertainty and volatile commodity prices.",
+    "Foreign exchange fluctuation reduced reported profit in the quarter.",
+    "The balance sheet remains strong with ample liquidity and low debt.",
+    "Management expects continued investment in manufacturing capacity.",
+    "Operating margin declined due to a one-time restructuring loss.",
+]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_lines(page_number: int, rng: random.Random, lines_per_page: int = 40) -> list:
+    lines = [f"Quarterly Financial Update - Page {page_number + 1}", ""]
+    for i in range(lines_per_page):
+        if i % 3 == 0:
+            lines.append(rng.choice(PROSE))
+        else:
+            item = rng.choice(LINE_ITEMS)
+            values = " ".join(f"${rng.randint(100, 99999):,}" for _ in range(3))
+            lines.append(f"{item} {values} {rng.uniform(-20, 40):.1f}%")
+    return lines
+
+
+def build_pdf(num_pages: int, seed: int = 0, lines_per_page: int = 40, pages: list = None) -> bytes:
+    """Return the bytes of a PDF with `num_pages` pages of financial-looking text
+
+    `pages` may supply the lines for each page explicitly (list of lists of str).
+    """
+    rng = random.Random(seed)
+    if pages is None:
+        pages = [page_lines(n, rng, lines_per_page) for n in range(num_pages)]
+
+    objects = []  # object bodies, object number = index + 1
+    objects.append(None)  # 1: catalog
+    objects.append(None)  # 2: page tree
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")  # 3: font
+
+    page_refs = []
+    for lines in pages:
+        stream = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for line in lines:
+            stream.append(f"({_escape(line)}) Tj T*")
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = b" ".join(b"%d 0 R" % ref for ref in page_refs)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_refs))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+
+def write_pdf(path: str, num_pages: int, seed: int = 0, **kwargs) -> str:
+    with open(path, "wb") as f:
+        f.write(build_pdf(num_pages, seed=seed, **kwargs))
+    return path
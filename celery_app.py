@@ -1,13 +1,52 @@
 from celery import Celery
+from kombu import Queue
 import os
 
 # Redis as broker & backend
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6380/0")
 
+# Tasks are enqueued by name so the API never imports the agent stack;
+# only workers load celery_tasks (through `include`)
+ANALYZE_TASK = "celery_tasks.analyze_document_task"
+
+# Single-document requests, batches and very large batches wait in separate queues,
+# so a tenant submitting hundreds of reports cannot starve interactive requests.
+# Workers started with `-Q interactive,batch,bulk` drain them in that order.
+INTERACTIVE_QUEUE = "interactive"
+BATCH_QUEUE = "batch"
+BULK_QUEUE = "bulk"
+QUEUES = (INTERACTIVE_QUEUE, BATCH_QUEUE, BULK_QUEUE)
+BULK_BATCH_MIN_FILES = int(os.getenv("BULK_BATCH_MIN_FILES", "50"))
+
+# A soft limit fails the analysis cleanly; the hard limit kills a hung worker child,
+# whose message is then redelivered (acks_late) or picked up by the reaper
+TASK_SOFT_TIME_LIMIT = int(os.getenv("TASK_SOFT_TIME_LIMIT", "900"))
+TASK_TIME_LIMIT = int(os.getenv("TASK_TIME_LIMIT", str(TASK_SOFT_TIME_LIMIT + 60)))
+TASK_MAX_RETRIES = int(os.getenv("TASK_MAX_RETRIES", "3"))  # retries after transient LLM/network errors
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", str(TASK_MAX_RETRIES + 2)))  # including redeliveries
+TASK_RETRY_BACKOFF = float(os.getenv("TASK_RETRY_BACKOFF", "10"))  # seconds, doubled per retry
+TASK_RETRY_BACKOFF_MAX = float(os.getenv("TASK_RETRY_BACKOFF_MAX", "600"))
+
+# Rows left "processing" this long after their last update belong to a lost worker
+STALE_PROCESSING_SECONDS = int(os.getenv("STALE_PROCESSING_SECONDS", str(TASK_TIME_LIMIT + 300)))
+REAPER_INTERVAL_SECONDS = float(os.getenv("REAPER_INTERVAL_SECONDS", "300"))
+REAP_TASK = "celery_tasks.reap_stale_analyses"
+
+# Old reports are removed from the result store (see result_store.py) along with their rows
+PURGE_TASK = "celery_tasks.purge_expired_results"
+PURGE_INTERVAL_SECONDS = float(os.getenv("PURGE_INTERVAL_SECONDS", "3600"))
+
+# Redis emulates priorities with one list per step; lower values run first
+PRIORITY_STEPS = [0, 3, 6, 9]
+PRIORITIES = {"high": 0, "normal": 3, "low": 6}
+DEFAULT_PRIORITY = PRIORITIES["normal"]
+PRIORITY_SEPARATOR = ":"
+
 celery_app = Celery(
     "financial_analyzer",
     broker=REDIS_URL,
     backend=REDIS_URL,
+    include=["celery_tasks"],
 )
 
 celery_app.conf.update(
@@ -16,4 +55,23 @@ celery_app.conf.update(
     accept_content=["json"],
     timezone="UTC",
     enable_utc=True,
-)
\ No newline at end of file
+    task_queues=[Queue(name) for name in QUEUES],
+    task_default_queue=INTERACTIVE_QUEUE,
+    task_default_priority=DEFAULT_PRIORITY,
+    task_routes={ANALYZE_TASK: {"queue": INTERACTIVE_QUEUE}},
+    broker_transport_options={
+        "priority_steps": PRIORITY_STEPS,
+        "sep": PRIORITY_SEPARATOR,
+        "queue_order_strategy": "priority",
+        # Unacked messages are redelivered after this; it must outlast the hard time limit
+        "visibility_timeout": max(3600, TASK_TIME_LIMIT * 2),
+    },
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Reserve one task at a time so queued high-priority work is not stuck behind prefetched jobs
+    worker_prefetch_multiplier=1,
+    beat_schedule={
+        "reap-stale-analyses": {"task": REAP_TASK, "schedule": REAPER_INTERVAL_SECONDS},
+        "purge-expired-results": {"task": PURGE_TASK, "schedule": PURGE_INTERVAL_SECONDS},
+    },
+)
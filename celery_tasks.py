@@ -1,60 +1,414 @@
+import contextvars
+import datetime
 import os
-from celery_app import celery_app
+import queue
+import random
+import socket
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import redis
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import worker_process_init, task_prerun, task_postrun
+from celery_app import (celery_app, ANALYZE_TASK, REAP_TASK, PURGE_TASK, REDIS_URL, INTERACTIVE_QUEUE, BATCH_QUEUE,
+                        TASK_SOFT_TIME_LIMIT, TASK_TIME_LIMIT, TASK_MAX_RETRIES, TASK_MAX_ATTEMPTS,
+                        TASK_RETRY_BACKOFF, TASK_RETRY_BACKOFF_MAX, STALE_PROCESSING_SECONDS)
 from database.models import SessionLocal, AnalysisResult
 from crewai import Crew, Process
-from agents import financial_analyst
-from task import analyze_financial_document
+from crewai.agents.agent_builder.utilities.base_token_process import TokenProcess
+from agents import build_agents, get_llm, get_search_tool
+from task import build_tasks
+from events import publish_event, current_task_id
+from tools import document_context
+from incremental import page_fingerprints, reanalyze, INCREMENTAL_FINGERPRINTS
+from result_store import save_report, delete_report, expired_reports, content_url, RESULT_RETENTION_DAYS
+from llm_cache import log_stats as log_llm_cache_stats
+from metrics import (stage_timer, record_usage, STAGE_SECONDS, TOOL_SECONDS, ANALYSES,
+                     INCREMENTAL_ANALYSES)
+import tracing
+import queue_stats  # registers the worker signal handlers behind /queue/status
 
-OUTPUT_DIR = "outputs"
-os.makedirs(OUTPUT_DIR, exist_ok=True)  # ensure output folder exists
+def _register_event_listeners():
+    """Relay streamed LLM tokens to the running task and time tool executions"""
+    try:
+        from crewai.utilities.events import crewai_event_bus, LLMStreamChunkEvent, ToolUsageFinishedEvent
+    except ImportError:
+        return
+    
+    @crewai_event_bus.on(LLMStreamChunkEvent)
+    def on_stream_chunk(source, event):
+        publish_event(current_task_id.get(), "token", chunk=event.chunk)
+    
+    @crewai_event_bus.on(ToolUsageFinishedEvent)
+    def on_tool_finished(source, event):
+        if event.started_at and event.finished_at:
+            TOOL_SECONDS.labels(event.tool_name).observe((event.finished_at - event.started_at).total_seconds())
+
+_register_event_listeners()
+
+@task_prerun.connect
+def start_task_span(task_id=None, task=None, **kwargs):
+    tracing.setup_tracing()
+    tracing.start_task_span(task_id, task.name, task.request)
+
+@task_postrun.connect
+def end_task_span(task_id=None, state=None, **kwargs):
+    tracing.end_task_span(task_id, state)
+
+# Crews are built once per worker process and reused across tasks. A crew is not
+# safe to run concurrently, so each running task checks out its own set of crews;
+# thread pools (-P threads) grow the pool up to their concurrency.
+_idle_crews = queue.SimpleQueue()
+
+def _on_step(step):
+    publish_event(current_task_id.get(), "progress", step=str(step))
+
+def _on_task_completed(output):
+    publish_event(current_task_id.get(), "task_completed", agent=output.agent, output=output.raw)
+
+def build_crews() -> dict:
+    """One single-task crew per pipeline step, around one set of agents"""
+    agents = build_agents()
+    tasks = build_tasks(agents)
+    steps = {
+        "analysis": ("financial_analyst", "analyze_financial_document"),
+        "verification": ("verifier", "verification"),
+        "investment": ("investment_advisor", "investment_analysis"),
+        "risk": ("risk_assessor", "risk_assessment"),
+    }
+    return {
+        name: Crew(
+            agents=[agents[agent]],
+            tasks=[tasks[task]],
+            process=Process.sequential,
+            step_callback=_on_step,
+            task_callback=_on_task_completed,
+        )
+        for name, (agent, task) in steps.items()
+    }
+
+def reset_crew(crew: Crew):
+    """Clear what a previous run left on the reused agents and tasks"""
+    for task in crew.tasks:
+        task.output = None
+    for agent in crew.agents:
+        agent.tools_results = []
+        # Crew token usage sums the agents' running totals; start them from zero
+        # so each kickoff reports (and record_usage counts) only its own tokens
+        agent._token_process = TokenProcess()
+
+@contextmanager
+def checkout_crews():
+    """Borrow a warm set of crews for one task, building one if all are in use"""
+    try:
+        crews = _idle_crews.get_nowait()
+    except queue.Empty:
+        crews = build_crews()
+    for crew in crews.values():
+        reset_crew(crew)
+    # A failed run may leave a branch still running on these crews, so only
+    # crews that finished cleanly go back to the pool
+    yield crews
+    _idle_crews.put(crews)
+
+@worker_process_init.connect
+def warm_worker(**kwargs):
+    """Build the LLM client, tools and crews once when a worker process starts"""
+    get_llm()
+    get_search_tool()
+    _idle_crews.put(build_crews())
+
+def kickoff(crew: Crew, inputs: dict) -> str:
+    """Run a warm crew and count its token usage"""
+    with stage_timer("crew_kickoff"):
+        output = crew.kickoff(inputs)
+    record_usage(getattr(output, "token_usage", None))
+    return str(output)
 
-@celery_app.task
-def analyze_document_task(task_id: str, query: str, file_path: str, file_name: str):
-    """Celery task to analyze financial documents and save results to output folder"""
+def run_full_report(crews: dict, query: str, file_path: str) -> str:
+    """Verify the document, then run the investment and risk analyses concurrently
+
+    Both branches get the same pre-extracted document context, so the wall-clock
+    time is about verification plus the slower branch rather than the sum.
+    """
+    inputs = {"query": query, "file_path": file_path}
+    verification_report = kickoff(crews["verification"], inputs)
+    publish_event(current_task_id.get(), "stage_completed", stage="verification")
+
+    with stage_timer("document_context"):
+        context = document_context(file_path, query)
+    inputs.update(document_context=context, verification_report=verification_report)
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        # Each branch runs in a copy of this context so events keep the task id
+        branches = {
+            name: executor.submit(contextvars.copy_context().run, kickoff, crews[name], dict(inputs))
+            for name in ("investment", "risk")
+        }
+        sections = {name: str(future.result()) for name, future in branches.items()}
+    finally:
+        # Do not wait for the other branch when one fails or the soft time limit fires
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return "\n\n".join([
+        "# Financial Analysis Report",
+        f"Query: {query}",
+        "## Document Verification",
+        verification_report,
+        "## Investment Analysis",
+        sections["investment"],
+        "## Risk Assessment",
+        sections["risk"],
+    ])
+
+def transient_errors() -> tuple:
+    """Exceptions worth retrying: rate limits, timeouts and dropped connections"""
+    errors = [ConnectionError, TimeoutError]
+    try:
+        import litellm
+        errors += [litellm.RateLimitError, litellm.APIConnectionError, litellm.Timeout,
+                   litellm.ServiceUnavailableError, litellm.InternalServerError]
+    except (ImportError, AttributeError):
+        pass
+    try:
+        import requests
+        errors += [requests.exceptions.ConnectionError, requests.exceptions.Timeout]
+    except ImportError:
+        pass
+    return tuple(errors)
+
+def retry_delay(retries: int) -> float:
+    """Exponential backoff with jitter: between half and all of base * 2^retries, capped"""
+    delay = min(TASK_RETRY_BACKOFF_MAX, TASK_RETRY_BACKOFF * 2 ** retries)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+# One running copy per analysis: a redelivered or duplicate message for a task that
+# another worker is still running finds the lock held and leaves it alone
+_lock_client = None
+
+def _redis() -> redis.Redis:
+    global _lock_client
+    if _lock_client is None:
+        _lock_client = redis.Redis.from_url(REDIS_URL)
+    return _lock_client
+
+def _lock_key(task_id: str) -> str:
+    return f"analysis-lock:{task_id}"
+
+def acquire_task_lock(task_id: str):
+    """Return a token if this worker now owns the task, None if another does
+
+    Fails open when Redis is unreachable; the row status still guards completed work.
+    """
+    token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4()}"
+    try:
+        if _redis().set(_lock_key(task_id), token, nx=True, ex=TASK_TIME_LIMIT + 60):
+            return token
+        return None
+    except redis.RedisError:
+        return token
+
+def release_task_lock(task_id: str, token: str):
+    try:
+        _redis().eval(
+            "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0",
+            1, _lock_key(task_id), token,
+        )
+    except redis.RedisError:
+        pass
+
+def task_lock_held(task_id: str) -> bool:
+    try:
+        return bool(_redis().exists(_lock_key(task_id)))
+    except redis.RedisError:
+        return False
+
+def _fail(db, result: AnalysisResult, task_id: str, error: str):
+    result.status = "failed"
+    result.result = f"Error: {error}"
+    result.inflight_fingerprint = None
+    db.commit()
+    ANALYSES.labels("failed").inc()
+    publish_event(task_id, "failed", error=error)
+
+@celery_app.task(name=ANALYZE_TASK, bind=True, acks_late=True, reject_on_worker_lost=True,
+                 soft_time_limit=TASK_SOFT_TIME_LIMIT, time_limit=TASK_TIME_LIMIT, max_retries=TASK_MAX_RETRIES)
+def analyze_document_task(self, task_id: str, query: str, file_path: str, file_name: str, mode: str = "standard"):
+    """Celery task to analyze financial documents and save the report to the result store
+
+    Safe to run more than once for the same task_id: finished analyses are not
+    redone, and only one worker at a time runs a given analysis.
+    """
     db = SessionLocal()
+    result = None
+    lock_token = None
+    context_token = current_task_id.set(task_id)
     
     try:
-        # Update status to processing
-        result = db.query(AnalysisResult).filter(AnalysisResult.id == task_id).first()
-        if result:
-            result.status = "processing"
-            db.commit()
+        result = db.get(AnalysisResult, task_id)
+        if result is None or result.status in ("completed", "failed"):
+            # Deleted, or a redelivery of work that already finished
+            return result.result if result else None
         
-        # Run the crew analysis
-        crew = Crew(
-            agents=[financial_analyst],
-            tasks=[analyze_financial_document],
-            process=Process.sequential,
-        )
+        lock_token = acquire_task_lock(task_id)
+        if lock_token is None:
+            ANALYSES.labels("duplicate").inc()
+            return None
         
-        analysis_result = crew.kickoff({'query': query, 'file_path': file_path})
-        analysis_text = str(analysis_result)
+        if result.attempts >= TASK_MAX_ATTEMPTS:
+            _fail(db, result, task_id, f"Gave up after {result.attempts} attempts")
+            return None
         
-        # Save result to output folder
-        output_file_name = f"analysis_{file_name.replace('.pdf','')}_{task_id}.txt"
-        output_file_path = os.path.join(OUTPUT_DIR, output_file_name)
-        with open(output_file_path, "w") as f:
-            f.write(analysis_text)
+        # Time since the row was queued (or requeued)
+        queued_at = result.updated_at or result.created_at
+        if queued_at:
+            STAGE_SECONDS.labels("queue_wait").observe(max(0.0, (datetime.datetime.utcnow() - queued_at).total_seconds()))
         
-        # Update database with path to output file
-        if result:
-            result.result = output_file_path  # store the path instead of raw text
-            result.status = "completed"
-            db.commit()
+        # Update status to processing
+        result.status = "processing"
+        result.attempts += 1
+        db.commit()
+        publish_event(task_id, "processing", attempt=result.attempts)
+        
+        # A revised filing only re-analyzes what changed since the earlier version
+        page_hashes = None
+        if result.previous_task_id or INCREMENTAL_FINGERPRINTS:
+            with stage_timer("page_fingerprints"):
+                page_hashes = page_fingerprints(file_path)
+        previous = db.get(AnalysisResult, result.previous_task_id) if result.previous_task_id else None
+        incremental = reanalyze(task_id, previous, query, mode, file_path, page_hashes) if previous else None
+        revision = None
+        if incremental is not None:
+            analysis_text, revision = incremental
+        else:
+            # Run the warm crews, streaming agent steps and task outputs to subscribers
+            with checkout_crews() as crews:
+                if mode == "full":
+                    analysis_text = run_full_report(crews, query, file_path)
+                else:
+                    analysis_text = kickoff(crews["analysis"], {'query': query, 'file_path': file_path})
+        
+        # Compress the report into the result store
+        with stage_timer("result_write"):
+            stored = save_report(task_id, analysis_text)
+        
+        # The row records where the report is stored; clients fetch it from the content URL
+        for column, value in stored.items():
+            setattr(result, column, value)
+        result.result = content_url(task_id)
+        result.page_hashes = page_hashes
+        result.revision = revision
+        result.status = "completed"
+        result.inflight_fingerprint = None
+        result.completed_at = datetime.datetime.utcnow()
+        db.commit()
+        ANALYSES.labels("completed").inc()
+        if revision:
+            INCREMENTAL_ANALYSES.inc()
+        publish_event(task_id, "completed", result=result.result,
+                      changes=revision["changes"] if revision else None)
         
         # Clean up uploaded file
         if os.path.exists(file_path):
             os.remove(file_path)
         
-        return output_file_path
+        return result.result
         
+    except SoftTimeLimitExceeded:
+        if result is not None:
+            _fail(db, result, task_id, f"Analysis exceeded the {TASK_SOFT_TIME_LIMIT} s time limit")
+        raise
+    
+    except transient_errors() as e:
+        if result is None:
+            raise
+        if self.request.retries < self.max_retries:
+            countdown = retry_delay(self.request.retries)
+            result.status = "pending"
+            db.commit()
+            ANALYSES.labels("retried").inc()
+            publish_event(task_id, "retrying", error=str(e), retry=self.request.retries + 1, countdown=countdown)
+            raise self.retry(exc=e, countdown=countdown)
+        _fail(db, result, task_id, str(e))
+        raise
+    
     except Exception as e:
         # Update status to failed
-        if result:
-            result.status = "failed"
-            result.result = f"Error: {str(e)}"
-            db.commit()
+        if result is not None:
+            _fail(db, result, task_id, str(e))
         raise e
     
+    finally:
+        if lock_token is not None:
+            release_task_lock(task_id, lock_token)
+        current_task_id.reset(context_token)
+        db.close()
+        log_llm_cache_stats()
+
+@celery_app.task(name=REAP_TASK)
+def reap_stale_analyses(limit: int = 100):
+    """Requeue analyses stuck in "processing" after their worker was lost, or fail them
+
+    Runs from celery beat. A row is stale when it has not been updated for
+    STALE_PROCESSING_SECONDS and no worker holds its lock.
+    """
+    db = SessionLocal()
+    requeued = []
+    failed = []
+    try:
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=STALE_PROCESSING_SECONDS)
+        stale = (db.query(AnalysisResult)
+                 .filter(AnalysisResult.status == "processing", AnalysisResult.updated_at < cutoff)
+                 .order_by(AnalysisResult.updated_at)
+                 .limit(limit)
+                 .all())
+        for result in stale:
+            if task_lock_held(result.id):
+                continue
+            if result.attempts >= TASK_MAX_ATTEMPTS or not result.file_path or not os.path.exists(result.file_path):
+                _fail(db, result, result.id, f"Worker lost after {result.attempts} attempts")
+                failed.append(result.id)
+                continue
+            result.status = "pending"
+            db.commit()
+            celery_app.send_task(
+                ANALYZE_TASK, args=(result.id, result.query, result.file_path, result.file_name, result.mode),
+                task_id=result.id, queue=BATCH_QUEUE if result.batch_id else INTERACTIVE_QUEUE
+            )
+            requeued.append(result.id)
+        return {"requeued": requeued, "failed": failed}
+    finally:
+        db.close()
+
+@celery_app.task(name=PURGE_TASK)
+def purge_expired_results(retention_days: float = RESULT_RETENTION_DAYS, limit: int = 1000):
+    """Delete finished analyses older than the retention period, with their stored reports
+
+    Runs from celery beat. Also removes stored reports of that age that no row
+    points to any more (deleted rows, or reports from before the result store).
+    """
+    if not retention_days:
+        return {"rows": 0, "reports": 0}
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    db = SessionLocal()
+    try:
+        expired = (db.query(AnalysisResult)
+                   .filter(AnalysisResult.status.in_(("completed", "failed")), AnalysisResult.updated_at < cutoff)
+                   .limit(limit)
+                   .all())
+        for result in expired:
+            db.delete(result)
+        db.commit()
+        
+        # Reports are written when their row completes, so they age together; keep
+        # any a newer row still shares (deduplicated copies point at the same report)
+        reports = 0
+        for key in expired_reports(cutoff):
+            if db.query(AnalysisResult.id).filter(AnalysisResult.result_key == key).first() is None:
+                delete_report(key)
+                reports += 1
+            if reports >= limit:
+                break
+        return {"rows": len(expired), "reports": reports}
     finally:
         db.close()
@@ -0,0 +1,36 @@
+"""Baseline analysis_results table
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-09-20
+
+Databases created by init_db() before migrations existed already have this
+table; it is only created when missing.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("analysis_results"):
+        return
+    op.create_table(
+        "analysis_results",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("query", sa.Text(), nullable=False),
+        sa.Column("file_name", sa.String(), nullable=False),
+        sa.Column("result", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_analysis_results_id", "analysis_results", ["id"])
+
+
+def downgrade():
+    op.drop_index("ix_analysis_results_id", table_name="analysis_results")
+    op.drop_table("analysis_results")
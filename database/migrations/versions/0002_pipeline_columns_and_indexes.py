@@ -0,0 +1,64 @@
+"""Pipeline columns and the /results pagination indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-09-20
+
+Adds the columns introduced since the baseline (dedup fingerprint, batches,
+retries and reaping) and the composite indexes behind keyset pagination.
+Tables created by a newer init_db() may already have some of them, so each
+column and index is only added when missing.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column("completed_at", sa.DateTime(), nullable=True),
+    sa.Column("document_sha256", sa.String(64), nullable=True),
+    sa.Column("fingerprint", sa.String(64), nullable=True),
+    sa.Column("batch_id", sa.String(), nullable=True),
+    sa.Column("mode", sa.String(), nullable=False, server_default="standard"),
+    sa.Column("file_path", sa.String(), nullable=True),
+    sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+    sa.Column("updated_at", sa.DateTime(), nullable=True),
+]
+
+INDEXES = {
+    "ix_analysis_results_fingerprint": ["fingerprint"],
+    "ix_analysis_results_batch_id": ["batch_id"],
+    "ix_analysis_results_status_created_at": ["status", "created_at", "id"],
+    "ix_analysis_results_created_at": ["created_at", "id"],
+}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing_columns = {column["name"] for column in inspector.get_columns("analysis_results")}
+    missing = [column for column in COLUMNS if column.name not in existing_columns]
+    if missing:
+        with op.batch_alter_table("analysis_results") as batch:
+            for column in missing:
+                batch.add_column(column)
+
+    if "updated_at" not in existing_columns:
+        op.execute("UPDATE analysis_results SET updated_at = COALESCE(completed_at, created_at)")
+
+    existing_indexes = {index["name"] for index in inspector.get_indexes("analysis_results")}
+    for name, columns in INDEXES.items():
+        if name not in existing_indexes:
+            op.create_index(name, "analysis_results", columns)
+
+
+def downgrade():
+    existing_indexes = {index["name"] for index in sa.inspect(op.get_bind()).get_indexes("analysis_results")}
+    for name in INDEXES:
+        if name in existing_indexes:
+            op.drop_index(name, table_name="analysis_results")
+    with op.batch_alter_table("analysis_results") as batch:
+        for column in reversed(COLUMNS):
+            batch.drop_column(column.name)
@@ -0,0 +1,52 @@
+"""Result store location of each report
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-09-21
+
+Reports used to be written uncompressed to outputs/ with the file path stored in
+`result`. Those rows are pointed at the same files through the local result
+store (whose default directory is outputs/), and `result` becomes the content URL.
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column("result_key", sa.String(), nullable=True),
+    sa.Column("result_encoding", sa.String(), nullable=True),
+    sa.Column("result_bytes", sa.Integer(), nullable=True),
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    existing_columns = {column["name"] for column in sa.inspect(bind).get_columns("analysis_results")}
+    missing = [column for column in COLUMNS if column.name not in existing_columns]
+    if missing:
+        with op.batch_alter_table("analysis_results") as batch:
+            for column in missing:
+                batch.add_column(column)
+
+    legacy = bind.execute(sa.text(
+        "SELECT id, result FROM analysis_results "
+        "WHERE status = 'completed' AND result_key IS NULL AND result LIKE '%analysis_%.txt'"
+    )).all()
+    for task_id, path in legacy:
+        bind.execute(
+            sa.text("UPDATE analysis_results SET result_key = :key, result_encoding = 'identity', "
+                    "result = :url WHERE id = :id"),
+            {"key": os.path.basename(path), "url": f"/results/{task_id}/content", "id": task_id},
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("analysis_results") as batch:
+        for column in reversed(COLUMNS):
+            batch.drop_column(column.name)
@@ -0,0 +1,37 @@
+"""Page fingerprints and revision links for incremental re-analysis
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-09-22
+
+Analyses completed before this revision have no page hashes, so a revised
+filing submitted against one of them gets a full analysis.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column("page_hashes", sa.JSON(), nullable=True),
+    sa.Column("previous_task_id", sa.String(), nullable=True),
+    sa.Column("revision", sa.JSON(), nullable=True),
+]
+
+
+def upgrade():
+    existing_columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("analysis_results")}
+    missing = [column for column in COLUMNS if column.name not in existing_columns]
+    if missing:
+        with op.batch_alter_table("analysis_results") as batch:
+            for column in missing:
+                batch.add_column(column)
+
+
+def downgrade():
+    with op.batch_alter_table("analysis_results") as batch:
+        for column in reversed(COLUMNS):
+            batch.drop_column(column.name)
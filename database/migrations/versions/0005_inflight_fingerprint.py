@@ -0,0 +1,35 @@
+"""Unique fingerprint of in-flight analyses
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+Two identical /analyze submissions arriving together could both miss the
+dedup lookup and both be queued. Rows now carry their fingerprint in a unique
+column while pending or processing, so the second insert fails and attaches
+to the first. Rows in flight during the upgrade are left without one.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+INDEX = "ix_analysis_results_inflight_fingerprint"
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "inflight_fingerprint" not in {column["name"] for column in inspector.get_columns("analysis_results")}:
+        with op.batch_alter_table("analysis_results") as batch:
+            batch.add_column(sa.Column("inflight_fingerprint", sa.String(64), nullable=True))
+    if INDEX not in {index["name"] for index in inspector.get_indexes("analysis_results")}:
+        op.create_index(INDEX, "analysis_results", ["inflight_fingerprint"], unique=True)
+
+
+def downgrade():
+    op.drop_index(INDEX, table_name="analysis_results")
+    with op.batch_alter_table("analysis_results") as batch:
+        batch.drop_column("inflight_fingerprint")
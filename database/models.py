@@ -1,11 +1,30 @@
-from sqlalchemy import create_engine, Column, String, Text, DateTime
+from sqlalchemy import create_engine, Column, String, Text, DateTime, Integer, Index, JSON
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import datetime
 import os
 
-DATABASE_URL = "sqlite:///./financial_docs.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./financial_docs.db")
 
+# Async drivers used by the API for each sync URL scheme
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
+
+def to_async_url(url: str) -> str:
+    """Return the async-driver form of a database URL"""
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+# Sync engine for Celery workers and scripts
 engine = create_engine(
     DATABASE_URL, 
     connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
@@ -13,10 +32,20 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the FastAPI endpoints
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
 Base = declarative_base()
 
 class AnalysisResult(Base):
     __tablename__ = "analysis_results"
+    __table_args__ = (
+        # Keyset pagination on /results walks (created_at, id), optionally within one status
+        Index("ix_analysis_results_status_created_at", "status", "created_at", "id"),
+        Index("ix_analysis_results_created_at", "created_at", "id"),
+    )
     
     id = Column(String, primary_key=True, index=True)
     query = Column(Text, nullable=False)
@@ -24,13 +53,40 @@ class AnalysisResult(Base):
     result = Column(Text, nullable=False)
     status = Column(String, default="pending")  # pending, processing, completed, failed
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+    document_sha256 = Column(String(64), nullable=True)
+    fingerprint = Column(String(64), nullable=True, index=True)  # document + query + agent config
+    # The fingerprint while a deduplicating /analyze submission is pending or processing, else NULL;
+    # unique, so concurrent identical submissions cannot both be queued
+    inflight_fingerprint = Column(String(64), nullable=True, index=True, unique=True)
+    batch_id = Column(String, nullable=True, index=True)
+    mode = Column(String, nullable=False, default="standard", server_default="standard")
+    file_path = Column(String, nullable=True)  # uploaded file, kept until the analysis completes
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")  # times a worker has started the task
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    # Where the report lives in the result store (see result_store.py)
+    result_key = Column(String, nullable=True)
+    result_encoding = Column(String, nullable=True)  # zstd, gzip or identity
+    result_bytes = Column(Integer, nullable=True)  # uncompressed size
+    # Incremental re-analysis (see incremental.py)
+    page_hashes = Column(JSON, nullable=True)  # SHA-256 of each page's content stream
+    previous_task_id = Column(String, nullable=True)  # analysis of the earlier version of the document
+    revision = Column(JSON, nullable=True)  # changes since the earlier version and per-section summaries
 
 def init_db():
     Base.metadata.create_all(bind=engine)
 
+async def init_async_db():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
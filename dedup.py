@@ -0,0 +1,53 @@
+import datetime
+import hashlib
+import json
+import os
+
+from sqlalchemy import select, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import AnalysisResult
+from llm_config import LLM_MODEL, LLM_TEMPERATURE
+
+# Bump when prompts, agents or tools change in a way that should invalidate reuse
+PIPELINE_VERSION = "1"
+
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def analysis_fingerprint(document_sha256: str, query: str, mode: str = "standard") -> str:
+    """Identify an analysis by document content, normalized query and agent configuration"""
+    payload = {
+        "document": document_sha256,
+        "query": normalize_query(query),
+        "config": {
+            "model": LLM_MODEL,
+            "temperature": LLM_TEMPERATURE,
+            "pipeline": PIPELINE_VERSION,
+            "mode": mode,
+        },
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+async def find_reusable_analysis(db: AsyncSession, fingerprint: str, ttl_seconds: int = DEDUP_TTL_SECONDS):
+    """Return a completed analysis within the TTL, or an in-flight one, with this fingerprint
+
+    Completed results are preferred over in-flight tasks; newer over older.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=ttl_seconds)
+    statement = (
+        select(AnalysisResult)
+        .where(AnalysisResult.fingerprint == fingerprint)
+        .where(or_(
+            and_(AnalysisResult.status == "completed", AnalysisResult.completed_at >= cutoff),
+            AnalysisResult.status.in_(["pending", "processing"]),
+        ))
+        .order_by((AnalysisResult.status == "completed").desc(), AnalysisResult.created_at.desc())
+        .limit(1)
+    )
+    return (await db.scalars(statement)).first()
@@ -0,0 +1,58 @@
+import contextvars
+import json
+import os
+import time
+
+import redis
+import redis.asyncio as aioredis
+
+from celery_app import REDIS_URL
+
+# Status events for analysis tasks, published by workers over Redis pub/sub and
+# relayed to clients by the API. Events are best effort: the database row stays
+# the source of truth, and a lost event only delays what /status already shows.
+EVENTS_REDIS_URL = os.getenv("EVENTS_REDIS_URL", REDIS_URL)
+TERMINAL_EVENTS = {"completed", "failed"}
+MAX_EVENT_TEXT = 4000
+
+# The analysis task whose agents are currently running in this context
+current_task_id = contextvars.ContextVar("current_task_id", default=None)
+
+_client = None
+_async_client = None
+
+
+def channel(task_id: str) -> str:
+    return f"analysis-events:{task_id}"
+
+
+def _redis() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(EVENTS_REDIS_URL)
+    return _client
+
+
+def async_redis() -> aioredis.Redis:
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.Redis.from_url(EVENTS_REDIS_URL)
+    return _async_client
+
+
+def publish_event(task_id: str, event: str, **data):
+    """Publish an event for `task_id`; never raises"""
+    if not task_id:
+        return
+    payload = {"task_id": task_id, "event": event, "timestamp": time.time(), **data}
+    for key, value in payload.items():
+        if isinstance(value, str) and len(value) > MAX_EVENT_TEXT:
+            payload[key] = value[:MAX_EVENT_TEXT] + "..."
+    try:
+        _redis().publish(channel(task_id), json.dumps(payload, default=str))
+    except redis.RedisError:
+        pass
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,252 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Extracted PDF text keyed by the SHA-256 of the PDF bytes.
+# Memory tier is a per-process LRU; disk tier is shared by every worker on the host.
+CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", ".cache/extraction")
+MEMORY_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+DISK_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_DISK_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# What reading a truncated or damaged disk entry raises
+_CORRUPT_ENTRY_ERRORS = (OSError, ValueError, EOFError, zlib.error)
+
+
+class CorruptEntry(Exception):
+    """A disk entry could not be read to the end; it has been removed"""
+
+
+def document_hash(path: str) -> str:
+    """Return the hex SHA-256 of the file at `path`."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Two-tier cache of per-page document text"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, memory_max_bytes: int = MEMORY_MAX_BYTES,
+                 disk_max_bytes: int = DISK_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # sha256 -> (pages, size)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.jsonl.gz")
+
+    def get(self, key: str):
+        """Return the cached list of page texts for `key`, or None"""
+        pages = self.iter_pages(key)
+        try:
+            return None if pages is None else list(pages)
+        except CorruptEntry:
+            return None
+
+    def iter_pages(self, key: str):
+        """Return an iterator over the cached page texts for `key`, or None
+
+        Disk entries are streamed one page at a time; they are promoted to the
+        memory tier only when small enough not to dominate it. A disk entry that
+        turns out to be damaged is removed and the iterator raises CorruptEntry
+        after the pages it could read.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                CACHE_LOOKUPS.labels("extraction", "memory_hit").inc()
+                return iter(entry[0])
+
+        path = self._disk_path(key)
+        try:
+            f = gzip.open(path, "rt", encoding="utf-8")
+            os.utime(path)  # mark as recently used for disk eviction
+        except OSError:
+            with self._lock:
+                self._stats["misses"] += 1
+            CACHE_LOOKUPS.labels("extraction", "miss").inc()
+            return None
+
+        with self._lock:
+            self._stats["disk_hits"] += 1
+        CACHE_LOOKUPS.labels("extraction", "disk_hit").inc()
+        return self._stream_disk(key, path, f)
+
+    def _stream_disk(self, key: str, path: str, f):
+        promote = []
+        promote_budget = self.memory_max_bytes // 8
+        try:
+            with f:
+                for line in f:
+                    page = json.loads(line)
+                    if promote is not None:
+                        promote_budget -= len(page)
+                        if promote_budget >= 0:
+                            promote.append(page)
+                        else:
+                            promote = None
+                    yield page
+        except _CORRUPT_ENTRY_ERRORS as e:
+            logger.warning("Removing damaged extraction cache entry %s: %s", path, e)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            raise CorruptEntry(key) from e
+        if promote is not None:
+            with self._lock:
+                self._remember(key, promote)
+
+    def put(self, key: str, pages):
+        """Store the page texts for `key` in both tiers"""
+        pages = list(pages)
+        with self._lock:
+            self._remember(key, pages)
+        writer = self.writer(key)
+        for page in pages:
+            writer.write(page)
+        writer.commit()
+
+    def writer(self, key: str) -> "PageWriter":
+        """Return a writer that streams pages for `key` into the disk tier"""
+        return PageWriter(self, key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            stats["evictions"] = stats["memory_evictions"] + stats["disk_evictions"]
+            stats["memory_entries"] = len(self._entries)
+            stats["memory_bytes"] = self._memory_bytes
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    # --- memory tier (caller holds the lock) ---
+
+    def _remember(self, key: str, pages):
+        size = sum(len(page) for page in pages)
+        if size > self.memory_max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous[1]
+        self._entries[key] = (pages, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self._stats["memory_evictions"] += 1
+
+    # --- disk tier ---
+
+    def _prune_disk(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".jsonl.gz"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._stats["disk_evictions"] += 1
+
+
+class PageWriter:
+    """Streams pages into a temp file that becomes the disk entry on commit()"""
+
+    def __init__(self, cache: ExtractionCache, key: str):
+        self.cache = cache
+        self.path = cache._disk_path(key)
+        # A private temp file renamed into place, so other workers never see a partial entry
+        self.tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = None
+        try:
+            os.makedirs(cache.cache_dir, exist_ok=True)
+            self._file = gzip.open(self.tmp_path, "wt", encoding="utf-8", compresslevel=3)
+        except OSError:
+            self._file = None
+
+    def write(self, page: str):
+        if self._file is None:
+            return
+        try:
+            self._file.write(json.dumps(page))
+            self._file.write("\n")
+        except OSError:
+            self.abort()
+
+    def commit(self):
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+            os.replace(self.tmp_path, self.path)
+        except OSError:
+            self.abort()
+            return
+        self._file = None
+        try:
+            self.cache._prune_disk()
+        except OSError:
+            pass
+
+    def abort(self):
+        """Discard an uncommitted entry; a no-op after commit()"""
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+extraction_cache = ExtractionCache()
@@ -0,0 +1,182 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Structured extraction of line items from financial statement text.
+# Lines are parsed column-wise with pandas string methods rather than one by one.
+
+# Column headers such as "Q2-2024 Q3-2024 Q4-2024", "FY2024 FY2023" or "2025 2024"
+_PERIOD = r"(?:Q[1-4][\s\-']*(?:FY)?\s?\d{2,4}|FY\s?\d{2,4}|(?:19|20)\d{2})"
+_HEADER_LINE = re.compile(rf"^(?:[A-Za-z ,]*?\s)?{_PERIOD}(?:\s+(?:{_PERIOD}|YoY|QoQ|%\s*change|change))+\s*$", re.IGNORECASE)
+_PERIOD_TOKEN = rf"(?P<period>{_PERIOD})"
+
+# A label followed by one or more figures, e.g. "Total revenues $25,500 (1,234) 12.5%"
+_LINE_ITEM = (r"^(?P<label>[A-Za-z][A-Za-z ,.'&/()\-]*?[A-Za-z)])\s*:?\s+"
+              r"(?P<values>[\(\-\$]*\d[\d,]*(?:\.\d+)?\)?%?(?:\s+[\(\-\$]*\d[\d,]*(?:\.\d+)?\)?%?)*)\s*$")
+_NUMBER = r"(?P<sign>\(|-)?\$?(?P<number>\d[\d,]*(?:\.\d+)?)\)?(?P<percent>%)?"
+
+_UNITS = re.compile(r"\(?\s*in\s+(thousands|millions|billions)", re.IGNORECASE)
+
+# Canonical line items and the labels they appear under
+LINE_ITEMS = {
+    "revenue": r"(?:total\s+)?(?:net\s+)?(?:revenues?|sales)",
+    "cost_of_revenue": r"(?:total\s+)?cost\s+of\s+(?:revenues?|sales)",
+    "gross_profit": r"(?:total\s+)?gross\s+(?:profit|margin)",
+    "operating_expenses": r"(?:total\s+)?operating\s+expenses",
+    "operating_income": r"(?:income|loss)\s+from\s+operations|operating\s+(?:income|profit)",
+    "net_income": r"net\s+(?:income|earnings|profit)(?:\s+attributable\s+to\s+[a-z ,.]+)?",
+    "total_assets": r"total\s+assets",
+    "current_assets": r"total\s+current\s+assets",
+    "total_liabilities": r"total\s+liabilities",
+    "current_liabilities": r"total\s+current\s+liabilities",
+    "total_equity": r"total\s+(?:stockholders|shareholders)'?\s+equity|total\s+equity",
+    "cash": r"(?:total\s+)?cash(?:,)?\s+(?:and\s+)?cash\s+equivalents(?:\s+and\s+investments)?",
+    "long_term_debt": r"long[\s\-]term\s+debt(?:\s+and\s+finance\s+leases)?",
+    "operating_cash_flow": r"(?:net\s+cash\s+provided\s+by\s+operating\s+activities|operating\s+cash\s+flows?)",
+    "capital_expenditures": r"capital\s+expenditures",
+    "free_cash_flow": r"free\s+cash\s+flows?",
+}
+
+# name -> (numerator, denominator)
+RATIOS = {
+    "gross_margin": ("gross_profit", "revenue"),
+    "operating_margin": ("operating_income", "revenue"),
+    "net_margin": ("net_income", "revenue"),
+    "return_on_assets": ("net_income", "total_assets"),
+    "return_on_equity": ("net_income", "total_equity"),
+    "debt_to_equity": ("total_liabilities", "total_equity"),
+    "current_ratio": ("current_assets", "current_liabilities"),
+    "liabilities_to_assets": ("total_liabilities", "total_assets"),
+    "free_cash_flow_margin": ("free_cash_flow", "revenue"),
+}
+
+
+def _lines_frame(pages) -> pd.DataFrame:
+    texts = []
+    page_numbers = []
+    for page_number, page in enumerate(pages, start=1):
+        page_lines = page.splitlines()
+        texts.extend(page_lines)
+        page_numbers.extend([page_number] * len(page_lines))
+    lines = pd.DataFrame({"page": page_numbers, "text": texts}, columns=["page", "text"])
+    lines["text"] = lines["text"].astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+    return lines
+
+
+def _header_periods(lines: pd.DataFrame) -> pd.Series:
+    """Period labels of the table header in effect on each line"""
+    is_header = lines["text"].str.match(_HEADER_LINE)
+    headers = lines.loc[is_header, "text"]
+    if headers.empty:
+        return pd.Series([None] * len(lines), index=lines.index, dtype=object)
+
+    periods = headers.str.extractall(_PERIOD_TOKEN)["period"].str.upper().str.replace(r"\s+", "", regex=True)
+    per_header = periods.groupby(level=0).agg(tuple)
+    header_for_line = pd.Series(per_header, index=lines.index).ffill()
+    return header_for_line.where(~is_header)
+
+
+def extract_line_items(pages) -> pd.DataFrame:
+    """Parse recognised line items into a long table
+
+    Returns one row per figure with columns item, label, period, value,
+    percent and page.
+    """
+    columns = ["item", "label", "period", "value", "percent", "page"]
+    lines = _lines_frame(pages)
+    if lines.empty:
+        return pd.DataFrame(columns=columns)
+
+    lines["periods"] = _header_periods(lines)
+    parsed = lines["text"].str.extract(_LINE_ITEM)
+    lines = lines.join(parsed).dropna(subset=["label"])
+    if lines.empty:
+        return pd.DataFrame(columns=columns)
+
+    # Parenthetical qualifiers such as "(GAAP)" or "(loss)" do not change the item
+    normalized = (lines["label"].str.lower()
+                  .str.replace(r"\([^)]*\)", " ", regex=True)
+                  .str.replace(r"[^a-z, '&\-]", "", regex=True)
+                  .str.replace(r"\s+", " ", regex=True)
+                  .str.strip(" ,"))
+    # Map every label to a canonical line item in one vectorized pass per item
+    matches = [normalized.str.fullmatch(pattern) for pattern in LINE_ITEMS.values()]
+    lines["item"] = np.select(matches, list(LINE_ITEMS), default="")
+    lines = lines[lines["item"] != ""]
+    if lines.empty:
+        return pd.DataFrame(columns=columns)
+
+    numbers = lines["values"].str.extractall(_NUMBER)
+    figures = numbers.reset_index(level="match").join(lines[["item", "label", "page", "periods"]])
+    value = pd.to_numeric(figures["number"].str.replace(",", "", regex=False), errors="coerce")
+    figures["value"] = np.where(figures["sign"].notna(), -value, value)
+    figures["percent"] = figures["percent"].notna()
+
+    # Figures are assigned to header periods by position; extra columns (YoY, % change) are dropped
+    match_index = figures["match"].to_numpy()
+    periods = figures["periods"].to_numpy()
+    figures["period"] = [
+        header[position] if isinstance(header, tuple) and position < len(header)
+        else (None if isinstance(header, tuple) else f"col{position + 1}")
+        for header, position in zip(periods, match_index)
+    ]
+    figures = figures.dropna(subset=["period", "value"])
+    # Currency line items keep their amounts, not the growth percentages printed beside them
+    figures = figures[~figures["percent"]]
+    figures = figures.drop_duplicates(subset=["item", "period"], keep="first")
+    return figures[columns].reset_index(drop=True)
+
+
+def compute_ratios(table: pd.DataFrame) -> pd.DataFrame:
+    """Standard ratios per period from a wide item x period table"""
+    periods = list(table.columns)
+    values = table.reindex(list(LINE_ITEMS)).to_numpy(dtype=float)
+    row = {item: index for index, item in enumerate(LINE_ITEMS)}
+
+    numerators = np.vstack([values[row[numerator]] for numerator, _ in RATIOS.values()])
+    denominators = np.vstack([values[row[denominator]] for _, denominator in RATIOS.values()])
+    valid = np.isfinite(numerators) & np.isfinite(denominators) & (denominators != 0)
+    ratios = np.divide(numerators, denominators, out=np.full_like(numerators, np.nan), where=valid)
+
+    frame = pd.DataFrame(ratios, index=list(RATIOS), columns=periods)
+    return frame.dropna(how="all")
+
+
+def extract_financials(pages) -> dict:
+    """Extract line items and ratios from an iterable of page texts
+
+    Returns a dict with the wide `line_items` table (canonical item x period),
+    the `ratios` table and the reporting `units` when the document states them.
+    """
+    pages = list(pages)
+    units = None
+    for page in pages:
+        found = _UNITS.search(page)
+        if found:
+            units = found.group(1).lower()
+            break
+
+    figures = extract_line_items(pages)
+    if figures.empty:
+        return {"line_items": pd.DataFrame(), "ratios": pd.DataFrame(), "units": units}
+
+    period_order = list(dict.fromkeys(figures["period"]))
+    item_order = [item for item in LINE_ITEMS if item in set(figures["item"])]
+    table = figures.pivot(index="item", columns="period", values="value").reindex(index=item_order, columns=period_order)
+    return {"line_items": table, "ratios": compute_ratios(table), "units": units}
+
+
+def format_financials(financials: dict) -> str:
+    """Render the extracted tables compactly for an LLM prompt"""
+    line_items = financials["line_items"]
+    if line_items.empty:
+        return "No structured financial line items found in the document."
+
+    units = financials["units"]
+    parts = [f"Line items{f' (in {units})' if units else ''}:",
+             line_items.astype(float).to_string(float_format=lambda value: f"{value:,.12g}", na_rep="-")]
+    ratios = financials["ratios"]
+    if not ratios.empty:
+        parts += ["", "Ratios:", ratios.to_string(float_format=lambda value: f"{value:.3f}", na_rep="-")]
+    return "\n".join(parts)
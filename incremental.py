@@ -0,0 +1,362 @@
+import contextvars
+import difflib
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+from dedup import normalize_query
+from extraction_cache import extraction_cache, document_hash
+from pdf_extractor import normalize_page_text, iter_document_pages
+from retrieval import chunk_pages
+from metrics import stage_timer
+from result_store import load_report
+
+logger = logging.getLogger(__name__)
+
+# Incremental re-analysis of a revised filing. Every analysis records a hash of
+# each page's content stream. A resubmission that names the earlier analysis
+# (previous_task_id) is aligned page by page against it: unchanged pages reuse the
+# earlier extracted text, only changed pages are extracted, and only the sections
+# whose text changed are summarized by the LLM. The summaries are merged into the
+# earlier report under "Revision notes", so no crew runs at all.
+INCREMENTAL_MAX_CHANGED_FRACTION = float(os.getenv("INCREMENTAL_MAX_CHANGED_FRACTION", "0.5"))
+INCREMENTAL_SUMMARY_WORKERS = int(os.getenv("INCREMENTAL_SUMMARY_WORKERS", "4"))
+# Fingerprint every analysis so a later revision can name it; when off, only
+# analyses that name an earlier version are fingerprinted
+INCREMENTAL_FINGERPRINTS = os.getenv("INCREMENTAL_FINGERPRINTS", "true").lower() in ("1", "true", "yes")
+SECTION_PROMPT_CHARS = 6000  # per version of a section sent to the LLM
+
+REVISION_MARKER = "## Revision notes"
+UNTITLED_SECTION = "Front matter"
+
+
+def _object_digest(obj, digest, memo: dict):
+    """Feed `obj` and everything it references into `digest`
+
+    Streams contribute their data as stored in the file, undecoded, so a Form
+    XObject, image or font program that changes changes the hash even when the
+    page's own content stream (e.g. "/Fm0 Do") does not, and no filter has to be
+    supported or run. Indirect objects are hashed once per document; /Parent
+    links are not followed.
+    """
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in memo:
+            memo[key] = b""  # guards against reference cycles
+            inner = hashlib.sha256()
+            _object_digest(obj.get_object(), inner, memo)
+            memo[key] = inner.digest()
+        digest.update(memo[key])
+    elif isinstance(obj, DictionaryObject):
+        if isinstance(obj, StreamObject):
+            digest.update(obj._data)
+        for name in sorted(obj):
+            if name != "/Parent":
+                digest.update(name.encode())
+                _object_digest(obj.raw_get(name), digest, memo)
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            _object_digest(item, digest, memo)
+    else:
+        digest.update(repr(obj).encode())
+
+
+def page_fingerprints(path: str) -> list:
+    """SHA-256 of each page's content stream and the resources it draws, without extracting any text
+
+    A page drawn differently but reading the same counts as changed, which only
+    costs one extra page extraction. Best effort: returns None when the file
+    cannot be fingerprinted, and the analysis then runs in full.
+    """
+    fingerprints = []
+    memo = {}
+    try:
+        for page in PdfReader(path).pages:
+            digest = hashlib.sha256()
+            _object_digest(page.raw_get("/Contents") if "/Contents" in page else None, digest, memo)
+            _object_digest(page.get("/Resources"), digest, memo)
+            fingerprints.append(digest.hexdigest())
+    except Exception:
+        logger.warning("Could not fingerprint the pages of %s", path, exc_info=True)
+        return None
+    return fingerprints
+
+
+def align_pages(old: list, new: list) -> dict:
+    """Match the pages of two versions; unmatched new pages must be extracted
+
+    Returns {"reused": {new index: old index}, "changed": [new indexes of edited
+    or inserted pages], "inserted": [new indexes], "deleted": [new indexes the
+    deleted pages stood before], "removed": count of deleted pages}. Inserted or
+    deleted pages do not disturb the match of the pages after them.
+    """
+    alignment = {"reused": {}, "changed": [], "inserted": [], "deleted": [], "removed": 0}
+    for tag, old_start, old_end, new_start, new_end in difflib.SequenceMatcher(
+            None, old, new, autojunk=False).get_opcodes():
+        if tag == "equal":
+            alignment["reused"].update(zip(range(new_start, new_end), range(old_start, old_end)))
+        elif tag == "delete":
+            alignment["deleted"].append(new_start)
+            alignment["removed"] += old_end - old_start
+        else:
+            alignment["changed"].extend(range(new_start, new_end))
+            if tag == "insert":
+                alignment["inserted"].extend(range(new_start, new_end))
+    return alignment
+
+
+def assemble_pages(path: str, old_pages: list, alignment: dict, total: int) -> list:
+    """Pages of the new version: reused text where unchanged, extracted where changed
+
+    The result is written to the extraction cache under the new document's hash,
+    so the tools reading it later do not extract it again.
+    """
+    reader = PdfReader(path)
+    pages = [
+        old_pages[alignment["reused"][index]] if index in alignment["reused"]
+        else normalize_page_text(reader.pages[index].extract_text())
+        for index in range(total)
+    ]
+    extraction_cache.put(document_hash(path), pages)
+    return pages
+
+
+def document_sections(pages: list) -> list:
+    """Sections in document order, each {"title", "pages", "text"}
+
+    A section is the text under one heading found by the retrieval chunker.
+    """
+    sections = []
+    for chunk in chunk_pages(pages):
+        title = chunk["section"] or UNTITLED_SECTION
+        if not sections or sections[-1]["title"] != title:
+            sections.append({"title": title, "pages": [], "text": []})
+        if chunk["page"] not in sections[-1]["pages"]:
+            sections[-1]["pages"].append(chunk["page"])
+        sections[-1]["text"].append(chunk["text"])
+    for section in sections:
+        section["text"] = "\n".join(section["text"])
+    return sections
+
+
+def _match_sections(earlier: list, sections: list) -> dict:
+    """Index in `sections` -> index in `earlier` of the same section
+
+    Unchanged sections (same heading and text) are matched first; between them,
+    sections are paired by heading. Sections of `earlier` may lack "text".
+    """
+    matched = {}
+
+    def pair(old_start, new_start, size):
+        matched.update(zip(range(new_start, new_start + size), range(old_start, old_start + size)))
+
+    for tag, old_start, old_end, new_start, new_end in difflib.SequenceMatcher(
+            None, [(section["title"], section.get("text")) for section in earlier],
+            [(section["title"], section["text"]) for section in sections], autojunk=False).get_opcodes():
+        if tag == "equal":
+            pair(old_start, new_start, old_end - old_start)
+        elif tag == "replace":
+            for block in difflib.SequenceMatcher(
+                    None, [section["title"] for section in earlier[old_start:old_end]],
+                    [section["title"] for section in sections[new_start:new_end]], autojunk=False).get_matching_blocks():
+                pair(old_start + block.a, new_start + block.b, block.size)
+    return matched
+
+
+def key_sections(sections: list, earlier=None) -> dict:
+    """Section key -> section, reusing the keys of the matching sections of an earlier version
+
+    `earlier` is the earlier version's keyed sections, or its outline
+    ([[key, title], ...] in document order). Inserting or removing a heading
+    therefore does not rename the sections after it. Other sections are keyed
+    by their title, numbered when the key is taken.
+    """
+    if isinstance(earlier, dict):
+        earlier_keys, earlier = list(earlier), list(earlier.values())
+    else:
+        earlier_keys = [key for key, _ in earlier or []]
+        earlier = [{"title": title} for _, title in earlier or []]
+    matched = _match_sections(earlier, sections)
+    taken = set(earlier_keys)
+    keyed = {}
+    for index, section in enumerate(sections):
+        if index in matched:
+            key = earlier_keys[matched[index]]
+        else:
+            key, number = section["title"], 1
+            while key in taken:
+                number += 1
+                key = f"{section['title']} ({number})"
+            taken.add(key)
+        keyed[key] = section
+    return keyed
+
+
+def section_outline(sections: dict) -> list:
+    return [[key, section["title"]] for key, section in sections.items()]
+
+
+def diff_sections(old: dict, new: dict) -> dict:
+    return {
+        "modified": [key for key in new if key in old and new[key]["text"] != old[key]["text"]],
+        "added": [key for key in new if key not in old],
+        "removed": [key for key in old if key not in new],
+    }
+
+
+def _clip(text: str) -> str:
+    return text if len(text) <= SECTION_PROMPT_CHARS else text[:SECTION_PROMPT_CHARS] + "\n[...]"
+
+
+def summarize_section(query: str, title: str, old_text, new_text: str) -> str:
+    """Ask the LLM what a revised (or new) section says, for the original query
+
+    `old_text` is "" for a new section and None when the earlier text is unknown.
+    """
+    from agents import get_llm
+    if old_text is None:
+        before = "The previous version is not available.\n\n"
+    elif old_text:
+        before = f"Previous version:\n{_clip(old_text)}\n\n"
+    else:
+        before = "This section is new in the revision.\n\n"
+    messages = [
+        {"role": "system", "content": "You are a senior financial analyst reviewing an amended filing."},
+        {"role": "user", "content": (
+            f"The analysis question is: {query}\n\n"
+            f"The section \"{title}\" of the filing was revised.\n\n"
+            f"{before}Revised version:\n{_clip(new_text)}\n\n"
+            "In a short paragraph, state what changed and how it affects the analysis. "
+            "Only use figures that appear in the text."
+        )},
+    ]
+    return str(get_llm().call(messages)).strip()
+
+
+def _page_span(pages: list) -> str:
+    if not pages:
+        return ""
+    return f"page {pages[0]}" if len(pages) == 1 else f"pages {pages[0]}-{pages[-1]}"
+
+
+def render_revision_notes(sections: dict, changes: dict) -> str:
+    pages = changes["pages"]
+    lines = [
+        REVISION_MARKER,
+        f"Compared with analysis {changes['previous_task_id']}: {pages['changed']} of {pages['total']} pages "
+        f"changed, {pages['added']} added and {pages['removed']} removed.",
+    ]
+    for key, section in sorted(sections.items(), key=lambda item: (item[1]["pages"] or [0])[0]):
+        lines.append(f"### {key} ({_page_span(section['pages'])}, revised in {section['revised_in']})")
+        lines.append(section["summary"])
+    if changes["sections"]["removed"]:
+        lines.append("### Removed sections")
+        lines.extend(f"- {key}" for key in changes["sections"]["removed"])
+    return "\n\n".join(lines)
+
+
+def merge_report(previous_report: str, sections: dict, changes: dict) -> str:
+    """The earlier report with its revision notes replaced by the updated ones"""
+    base = previous_report.split(f"\n{REVISION_MARKER}\n", 1)[0].rstrip()
+    if not sections and not changes["sections"]["removed"]:
+        return base
+    return f"{base}\n\n{render_revision_notes(sections, changes)}"
+
+
+def reanalyze(task_id: str, previous, query: str, mode: str, file_path: str, page_hashes: list):
+    """Update the analysis `previous` for the revised document at `file_path`
+
+    Returns (report, revision) or None when a full analysis is needed instead: a
+    different question or mode, too many changed pages, or an earlier report that
+    is no longer stored. `revision` holds the diff ("changes"), and the per-section
+    summaries and section keys ("outline") carried into later revisions.
+
+    If the earlier version's text has left the extraction cache, the whole new
+    version is extracted and every section on a changed page counts as modified.
+    """
+    if (not page_hashes or previous is None or previous.status != "completed" or not previous.page_hashes
+            or not previous.result_key or previous.mode != mode
+            or normalize_query(previous.query) != normalize_query(query)):
+        return None
+
+    alignment = align_pages(previous.page_hashes, page_hashes)
+    if len(alignment["changed"]) > INCREMENTAL_MAX_CHANGED_FRACTION * max(1, len(page_hashes)):
+        return None
+    try:
+        previous_report = load_report(previous.result_key, previous.result_encoding)
+    except FileNotFoundError:
+        return None
+
+    old_pages = extraction_cache.get(previous.document_sha256) if previous.document_sha256 else None
+    if old_pages is not None and len(old_pages) != len(previous.page_hashes):
+        old_pages = None
+    with stage_timer("pdf_extraction"):
+        if old_pages is not None:
+            pages = assemble_pages(file_path, old_pages, alignment, len(page_hashes))
+            reextracted = len(alignment["changed"])
+        else:
+            logger.info("Text of %s is no longer cached; extracting all of %s", previous.id, task_id)
+            pages = list(iter_document_pages(file_path))
+            reextracted = len(pages)
+    # Sections keep the keys the earlier analysis gave them (see key_sections)
+    previous_outline = (previous.revision or {}).get("outline")
+    if old_pages is not None:
+        old_sections = key_sections(document_sections(old_pages), previous_outline)
+        new_sections = key_sections(document_sections(pages), old_sections)
+        section_changes = diff_sections(old_sections, new_sections)
+    else:
+        old_sections = {}
+        new_sections = key_sections(document_sections(pages), previous_outline)
+        old_keys = [key for key, _ in previous_outline] if previous_outline else list(new_sections)
+        # Page numbers are 1-based; a deletion touches the page before it
+        changed_pages = {index + 1 for index in alignment["changed"]} | set(alignment["deleted"])
+        section_changes = {
+            "modified": [key for key, section in new_sections.items()
+                         if key in old_keys and changed_pages & set(section["pages"])],
+            "added": [key for key in new_sections if key not in old_keys],
+            "removed": [key for key in old_keys if key not in new_sections],
+        }
+
+    # Summaries of earlier revisions carry over; revised sections get new ones
+    carried = dict((previous.revision or {}).get("sections", {}))
+    revised = section_changes["modified"] + section_changes["added"]
+    executor = ThreadPoolExecutor(max_workers=max(1, min(INCREMENTAL_SUMMARY_WORKERS, len(revised))))
+    try:
+        with stage_timer("section_summaries"):
+            futures = {
+                key: executor.submit(
+                    contextvars.copy_context().run, summarize_section, query, new_sections[key]["title"],
+                    old_sections[key]["text"] if key in old_sections else ("" if key in section_changes["added"] else None),
+                    new_sections[key]["text"]
+                )
+                for key in revised
+            }
+            for key, future in futures.items():
+                carried[key] = {"summary": future.result(), "revised_in": task_id}
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    for key in section_changes["removed"]:
+        carried.pop(key, None)
+    sections = {}
+    for key, section in carried.items():
+        if key in new_sections:
+            sections[key] = dict(section, pages=new_sections[key]["pages"])
+
+    changes = {
+        "previous_task_id": previous.id,
+        "pages": {
+            "total": len(page_hashes),
+            "reused": len(alignment["reused"]),
+            "changed": len(alignment["changed"]) - len(alignment["inserted"]),
+            "added": len(alignment["inserted"]),
+            "removed": alignment["removed"],
+            "reextracted": reextracted,
+        },
+        "sections": section_changes,
+    }
+    revision = {"changes": changes, "sections": sections, "outline": section_outline(new_sections)}
+    return merge_report(previous_report, sections, changes), revision
@@ -0,0 +1,44 @@
+import re
+
+# Terms reported by analyze_investment and assess_risk
+FINANCIAL_TERMS = ("revenue", "profit", "loss", "assets", "liabilities",
+                   "cash flow", "balance sheet", "income statement")
+RISK_TERMS = ("debt", "liability", "loss", "deficit", "cash flow",
+              "risk", "uncertainty", "volatile", "fluctuation")
+
+
+class KeywordScanner:
+    """Case-insensitive multi-term matcher that makes one pass over the text
+
+    All terms are compiled into a single alternation (longest first), so an
+    occurrence of a term inside a longer term is only counted for the longer one.
+    """
+
+    def __init__(self, terms):
+        self.terms = tuple(dict.fromkeys(term.lower() for term in terms))
+        alternation = "|".join(re.escape(term) for term in sorted(self.terms, key=len, reverse=True))
+        self._pattern = re.compile(alternation)
+
+    def scan(self, chunks) -> dict:
+        """Count and locate every term across an iterable of text chunks
+
+        Returns a dict with per-term `counts`, per-term character `positions`
+        (offsets into the concatenated chunks) and the total `length`.
+        """
+        if isinstance(chunks, str):
+            chunks = [chunks]
+
+        counts = dict.fromkeys(self.terms, 0)
+        positions = {term: [] for term in self.terms}
+        offset = 0
+        for chunk in chunks:
+            for match in self._pattern.finditer(chunk.lower()):
+                term = match.group()
+                counts[term] += 1
+                positions[term].append(offset + match.start())
+            offset += len(chunk)
+
+        return {"counts": counts, "positions": positions, "length": offset}
+
+
+document_scanner = KeywordScanner(FINANCIAL_TERMS + RISK_TERMS)
@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import redis
+from crewai import LLM
+
+from celery_app import REDIS_URL
+from extraction_cache import document_hash
+from metrics import stage_timer, CACHE_LOOKUPS, LLM_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Cache of LLM responses keyed on model, temperature and normalized messages.
+# A per-process LRU sits in front of an optional shared backend ("redis" or
+# "sqlite") so identical prompts across jobs and workers are answered once.
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory").lower()  # memory | redis | sqlite | none
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_REDIS_URL = os.getenv("LLM_CACHE_REDIS_URL", REDIS_URL)
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH", ".cache/llm_cache.sqlite3")
+
+CACHE_VERSION = "2"  # 2: upload paths in responses are stored as document tokens
+CHARS_PER_TOKEN = 4  # rough estimate, as in retrieval.py
+
+# Uploads are stored under a random name; the same document must give the same key
+_UPLOAD_PATH = re.compile(r"[\w./\\-]*financial_document_[0-9a-f\-]{36}\.pdf")
+_DOCUMENT_TOKEN = re.compile(r"<document:([0-9a-f]{64})>")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=256)
+def _path_hash(path: str, mtime: float, size: int) -> str:
+    return document_hash(path)
+
+
+def _document_token(match) -> str:
+    path = match.group(0)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path  # a missing upload keeps its own name, so it never shares a key
+    return f"<document:{_path_hash(path, stat.st_mtime, stat.st_size)}>"
+
+
+def tokenize_paths(text: str) -> str:
+    """Replace upload paths with the content hash of the document they name"""
+    return _UPLOAD_PATH.sub(_document_token, text)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and replace upload paths with the document's content hash"""
+    return _WHITESPACE.sub(" ", tokenize_paths(text)).strip()
+
+
+def message_text(messages) -> str:
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(message.get("content") or "") for message in messages)
+
+
+def restore_paths(response: str, prompt: str):
+    """Put this request's upload paths back in place of the tokens in a cached response
+
+    A cached ReAct turn names the document it reads (`Action Input: {"path": ...}`);
+    the file it was first recorded for has usually been deleted since. Returns
+    None when the response names a document that is not in this prompt.
+    """
+    paths = {}
+    for match in _UPLOAD_PATH.finditer(prompt):
+        token = _document_token(match)
+        if token != match.group(0):
+            paths.setdefault(_DOCUMENT_TOKEN.fullmatch(token).group(1), match.group(0))
+    unresolved = []
+
+    def replace(match):
+        if match.group(1) not in paths:
+            unresolved.append(match.group(1))
+            return match.group(0)
+        return paths[match.group(1)]
+
+    restored = _DOCUMENT_TOKEN.sub(replace, response)
+    return None if unresolved else restored
+
+
+def cache_key(model: str, temperature, messages) -> str:
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    normalized = [
+        {"role": message.get("role", "user"), "content": normalize_text(str(message.get("content") or ""))}
+        for message in messages
+    ]
+    payload = {"version": CACHE_VERSION, "model": model, "temperature": temperature, "messages": normalized}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class MemoryBackend:
+    """Per-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, entry)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, entry: dict, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Shared by every worker; Redis expires the entries"""
+
+    def __init__(self, url: str = LLM_CACHE_REDIS_URL, prefix: str = "llm-cache:"):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key: str, entry: dict, ttl: int):
+        self.client.set(self.prefix + key, json.dumps(entry), ex=ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}*"):
+            self.client.delete(key)
+
+
+class SQLiteBackend:
+    """Shared by the workers on one host; expired rows are pruned on write"""
+
+    PRUNE_EVERY = 256
+
+    def __init__(self, path: str = LLM_CACHE_SQLITE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, entry TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT entry FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key: str, entry: dict, ttl: int):
+        with self._lock:
+            now = time.time()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, entry, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(entry), now + ttl),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._connection.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM llm_cache")
+            self._connection.commit()
+
+
+BACKENDS = {"redis": RedisBackend, "sqlite": SQLiteBackend}
+
+
+class ResponseCache:
+    """In-process LRU in front of an optional shared backend, with hit statistics"""
+
+    def __init__(self, backend: str = LLM_CACHE_BACKEND, ttl: int = LLM_CACHE_TTL_SECONDS):
+        self.enabled = backend != "none"
+        self.ttl = ttl
+        self.memory = MemoryBackend()
+        self.shared = BACKENDS[backend]() if backend in BACKENDS else None
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "errors": 0,
+            "tokens_saved": 0,
+            "seconds_saved": 0.0,
+        }
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def get(self, key: str):
+        """Return the cached entry for `key`, or None; backend errors count as misses"""
+        if not self.enabled:
+            return None
+        entry = self.memory.get(key)
+        tier = "memory_hits"
+        if entry is None and self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except (redis.RedisError, sqlite3.Error, ValueError):
+                self._count(errors=1)
+                entry = None
+            if entry is not None:
+                tier = "shared_hits"
+                self.memory.set(key, entry, self.ttl)
+        if entry is None:
+            self._count(misses=1)
+            CACHE_LOOKUPS.labels("llm", "miss").inc()
+            return None
+        self._count(**{tier: 1, "tokens_saved": entry["tokens"], "seconds_saved": entry["seconds"]})
+        CACHE_LOOKUPS.labels("llm", tier[:-1]).inc()
+        LLM_TOKENS.labels("saved_by_cache").inc(entry["tokens"])
+        return entry
+
+    def put(self, key: str, response: str, seconds: float, prompt_chars: int):
+        if not self.enabled:
+            return
+        entry = {
+            "response": response,
+            "seconds": seconds,
+            "tokens": (prompt_chars + len(response)) // CHARS_PER_TOKEN,
+            "created_at": time.time(),
+        }
+        self.memory.set(key, entry, self.ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, entry, self.ttl)
+            except (redis.RedisError, sqlite3.Error):
+                self._count(errors=1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hits"] = stats["memory_hits"] + stats["shared_hits"]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+        return stats
+
+    def clear(self):
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+
+response_cache = ResponseCache()
+
+
+class CachedLLM(LLM):
+    """LLM whose plain completions are served from `response_cache` when possible
+
+    Calls that pass tools or functions are not cached, since their result may
+    depend on running the tools.
+    """
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        if tools or available_functions:
+            with stage_timer("llm_call"):
+                return super().call(messages, tools=tools, callbacks=callbacks,
+                                    available_functions=available_functions, **kwargs)
+
+        key = cache_key(self.model, self.temperature, messages)
+        entry = response_cache.get(key)
+        if entry is not None:
+            response = restore_paths(entry["response"], message_text(messages))
+            if response is not None:
+                return response
+
+        start = time.perf_counter()
+        with stage_timer("llm_call"):
+            response = super().call(messages, tools=tools, callbacks=callbacks,
+                                    available_functions=available_functions, **kwargs)
+        if isinstance(response, str) and response:
+            prompt = messages if isinstance(messages, str) else json.dumps(messages, default=str)
+            response_cache.put(key, tokenize_paths(response), time.perf_counter() - start, len(prompt))
+        return response
+
+
+def log_stats():
+    logger.info("LLM response cache: %s", response_cache.stats())
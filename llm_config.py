@@ -0,0 +1,10 @@
+import os
+
+# Model settings shared by the agents and anything that keys on the agent configuration
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.1"))
+LLM_STREAM = os.getenv("LLM_STREAM", "true").lower() in ("1", "true", "yes")
+
+# "standard" runs the financial analyst alone; "full" verifies the document and then
+# runs the investment and risk analyses in parallel
+ANALYSIS_MODES = ("standard", "full")
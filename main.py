@@ -1,18 +1,45 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Request, Query
+from fastapi.responses import StreamingResponse, Response
+from redis.exceptions import RedisError
+from sqlalchemy import select, insert, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import base64
+import datetime
+import json
 import os
 import uuid
-from database.models import init_db, get_db, AnalysisResult
-from celery_tasks import analyze_document_task
-from celery_app import celery_app
+from typing import List, Optional
+from database.models import init_async_db, get_async_db, AsyncSessionLocal, AnalysisResult
+from celery import group
+from celery_app import (celery_app, ANALYZE_TASK, INTERACTIVE_QUEUE, BATCH_QUEUE, BULK_QUEUE, BULK_BATCH_MIN_FILES,
+                        PRIORITIES)
+from events import async_redis, channel, format_sse, TERMINAL_EVENTS
+from dedup import analysis_fingerprint, find_reusable_analysis
+from llm_config import ANALYSIS_MODES
+from queue_stats import queue_depths, worker_stats
+from rate_limit import enforce_rate_limit, RateLimitMiddleware
+from result_store import content_response, content_url, delete_report
+from metrics import stage_timer, render as render_metrics, CONTENT_TYPE_LATEST
+from tracing import instrument_app, inject_headers
+from uploads import save_upload, upload_path, UploadLimitMiddleware, MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES, MAX_BATCH_FILES
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()  # initialize database
+    await init_async_db()  # initialize database
     yield
 
+EVENTS_HEARTBEAT_INTERVAL = 15.0  # seconds between keep-alive comments
+EVENTS_POLL_INTERVAL = 2.0  # seconds between row checks when Redis is unavailable
+
 app = FastAPI(title="Financial Document Analyzer with Queue", lifespan=lifespan)
+instrument_app(app)  # no-op unless tracing is enabled
+
+app.add_middleware(UploadLimitMiddleware)  # 413 before an oversized body is parsed
+app.add_middleware(RateLimitMiddleware)  # 429 before the body is read
 
 @app.get("/")
 async def root():
@@ -23,41 +50,92 @@ async def root():
 async def analyze_document(
     file: UploadFile = File(...),
     query: str = Form(default="Analyze this financial document for investment insights"),
-    db: Session = Depends(get_db)
+    force: bool = Form(default=False),
+    mode: str = Form(default="standard"),
+    priority: str = Form(default="normal"),
+    previous_task_id: Optional[str] = Form(default=None),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Queue financial document analysis"""
+    """Queue financial document analysis
+    
+    `mode` is "standard" (financial analyst only) or "full" (verification, then the
+    investment and risk analyses in parallel, merged into one report).
+    Identical (document, query, mode) submissions reuse a completed analysis or attach
+    to the one in flight, unless `force` is set.
+    `priority` ("high", "normal" or "low") orders the request within the interactive queue.
+    `previous_task_id` names the completed analysis of an earlier version of the document;
+    only the pages and sections that changed since then are re-analyzed.
+    """
+    
+    if mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=422, detail=f"mode must be one of: {', '.join(ANALYSIS_MODES)}")
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=422, detail=f"priority must be one of: {', '.join(PRIORITIES)}")
+    if previous_task_id:
+        previous = await db.get(AnalysisResult, previous_task_id)
+        if not previous:
+            raise HTTPException(status_code=404, detail="Previous analysis not found")
+        if previous.status != "completed":
+            raise HTTPException(status_code=409, detail=f"Previous analysis is {previous.status}")
     
     task_id = str(uuid.uuid4())
     file_id = str(uuid.uuid4())
-    file_path = f"output/financial_document_{file_id}.pdf"
+    file_path = upload_path(file_id)
     
     try:
-        os.makedirs("data", exist_ok=True)
-        
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        with stage_timer("upload_write"):
+            _, document_sha256 = await save_upload(file, file_path)
         
         if not query or query.strip() == "":
             query = "Analyze this financial document for investment insights"
         
+        fingerprint = analysis_fingerprint(document_sha256, query, mode)
+        if not force:
+            existing = await find_reusable_analysis(db, fingerprint)
+            if existing:
+                os.remove(file_path)
+                return deduplicated_response(existing, query, file.filename)
+        
         db_result = AnalysisResult(
             id=task_id,
             query=query.strip(),
             file_name=file.filename,
             result="Processing...",
-            status="pending"
+            status="pending",
+            document_sha256=document_sha256,
+            fingerprint=fingerprint,
+            inflight_fingerprint=None if force else fingerprint,
+            mode=mode,
+            file_path=file_path,
+            previous_task_id=previous_task_id or None
         )
         db.add(db_result)
-        db.commit()
+        try:
+            with stage_timer("db_insert"):
+                await db.commit()
+        except IntegrityError:
+            # An identical submission was queued since the lookup above
+            await db.rollback()
+            existing = await find_reusable_analysis(db, fingerprint)
+            if not existing:
+                raise
+            os.remove(file_path)
+            return deduplicated_response(existing, query, file.filename)
         
-        celery_task = analyze_document_task.delay(task_id, query.strip(), file_path, file.filename)
+        # The Celery task id is the analysis id, so duplicates can attach to it
+        celery_task = celery_app.send_task(
+            ANALYZE_TASK, args=(task_id, query.strip(), file_path, file.filename, mode), task_id=task_id,
+            queue=INTERACTIVE_QUEUE, priority=PRIORITIES[priority], headers=inject_headers()
+        )
         
         return {
             "status": "queued",
             "task_id": task_id,
             "celery_task_id": celery_task.id,
             "query": query,
+            "mode": mode,
+            "priority": priority,
+            "previous_task_id": previous_task_id or None,
             "file_processed": file.filename,
             "message": "Analysis queued successfully. Use /status/{task_id} to check progress."
         }
@@ -68,11 +146,187 @@ async def analyze_document(
                 os.remove(file_path)
             except:
                 pass
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=f"Error queueing analysis: {str(e)}")
 
+def deduplicated_response(existing: AnalysisResult, query: str, file_name: str) -> dict:
+    if existing.status == "completed":
+        return {
+            "status": "completed",
+            "task_id": existing.id,
+            "celery_task_id": existing.id,
+            "query": query,
+            "file_processed": file_name,
+            "result": existing.result,
+            "deduplicated": True,
+            "message": "Identical analysis already completed; returning the existing result."
+        }
+    return {
+        "status": "queued",
+        "task_id": existing.id,
+        "celery_task_id": existing.id,
+        "query": query,
+        "file_processed": file_name,
+        "deduplicated": True,
+        "message": "Identical analysis already in progress. Use /status/{task_id} to check progress."
+    }
+
+@app.post("/analyze/batch")
+async def analyze_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    queries: List[str] = Form(default=[]),
+    force: bool = Form(default=False),
+    mode: str = Form(default="standard"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Queue many documents in one request
+    
+    `queries` holds one query per file, a single query for all files, or nothing for the default.
+    Completed identical analyses are reused; everything else is dispatched as one Celery group
+    on the batch queue, or the bulk queue from BULK_BATCH_MIN_FILES files.
+    """
+    
+    if mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=422, detail=f"mode must be one of: {', '.join(ANALYSIS_MODES)}")
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds the {MAX_BATCH_FILES} file limit")
+    if len(queries) not in (0, 1, len(files)):
+        raise HTTPException(status_code=422, detail="Provide one query per file, a single query, or none")
+    await enforce_rate_limit(request, cost=len(files), prepaid=1)
+    
+    default_query = "Analyze this financial document for investment insights"
+    if len(queries) <= 1:
+        queries = [queries[0] if queries else default_query] * len(files)
+    
+    batch_id = str(uuid.uuid4())
+    rows = []
+    file_paths = []
+    
+    try:
+        used_bytes = 0
+        for file, query in zip(files, queries):
+            query = query.strip() or default_query
+            file_path = upload_path(str(uuid.uuid4()))
+            file_paths.append(file_path)
+            with stage_timer("upload_write"):
+                size, document_sha256 = await save_upload(
+                    file, file_path, max_bytes=min(MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES - used_bytes)
+                )
+            used_bytes += size
+            
+            row = {
+                "id": str(uuid.uuid4()),
+                "query": query,
+                "file_name": file.filename,
+                "result": "Processing...",
+                "status": "pending",
+                "document_sha256": document_sha256,
+                "fingerprint": analysis_fingerprint(document_sha256, query, mode),
+                "batch_id": batch_id,
+                "mode": mode,
+                "file_path": file_path,
+            }
+            if not force:
+                existing = await find_reusable_analysis(db, row["fingerprint"])
+                if existing and existing.status == "completed":
+                    # The copy shares the stored report of the existing analysis
+                    row.update(status="completed", result=content_url(row["id"]), completed_at=existing.completed_at,
+                               result_key=existing.result_key, result_encoding=existing.result_encoding,
+                               result_bytes=existing.result_bytes)
+            rows.append(row)
+        
+        # One transaction for the whole batch
+        with stage_timer("db_insert"):
+            await db.execute(insert(AnalysisResult), rows)
+            await db.commit()
+        
+        for row in rows:
+            if row["status"] == "completed" and os.path.exists(row["file_path"]):
+                os.remove(row["file_path"])
+        
+        pending = [row for row in rows if row["status"] == "pending"]
+        queue = BULK_QUEUE if len(files) >= BULK_BATCH_MIN_FILES else BATCH_QUEUE
+        if pending:
+            headers = inject_headers()
+            group(
+                celery_app.signature(
+                    ANALYZE_TASK, args=(row["id"], row["query"], row["file_path"], row["file_name"], mode),
+                    task_id=row["id"], queue=queue, headers=headers
+                )
+                for row in pending
+            ).apply_async()
+        
+        return {
+            "status": "queued",
+            "batch_id": batch_id,
+            "total": len(rows),
+            "queued": len(pending),
+            "reused": len(rows) - len(pending),
+            "queue": queue,
+            "task_ids": [row["id"] for row in rows],
+            "message": "Batch queued successfully. Use /batch/{batch_id} to check progress."
+        }
+        
+    except Exception as e:
+        for file_path in file_paths:
+            if os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except:
+                    pass
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail=f"Error queueing batch: {str(e)}")
+
+@app.get("/batch/{batch_id}")
+async def get_batch_status(batch_id: str, db: AsyncSession = Depends(get_async_db)):
+    counts = dict((await db.execute(
+        select(AnalysisResult.status, func.count())
+        .where(AnalysisResult.batch_id == batch_id)
+        .group_by(AnalysisResult.status)
+    )).all())
+    if not counts:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    items = (await db.execute(
+        select(AnalysisResult.id, AnalysisResult.status, AnalysisResult.file_name,
+               AnalysisResult.query, AnalysisResult.completed_at)
+        .where(AnalysisResult.batch_id == batch_id)
+        .order_by(AnalysisResult.created_at, AnalysisResult.id)
+    )).all()
+    
+    total = sum(counts.values())
+    finished = counts.get("completed", 0) + counts.get("failed", 0)
+    if finished == total:
+        status = "failed" if counts.get("completed", 0) == 0 else "completed"
+    elif counts.get("processing", 0) or finished:
+        status = "processing"
+    else:
+        status = "pending"
+    
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "total": total,
+        "counts": counts,
+        "progress": round(finished / total, 4),
+        "items": [
+            {
+                "task_id": item.id,
+                "status": item.status,
+                "file_name": item.file_name,
+                "query": item.query,
+                "completed_at": item.completed_at
+            }
+            for item in items
+        ]
+    }
+
 @app.get("/status/{task_id}")
-async def get_analysis_status(task_id: str, db: Session = Depends(get_db)):
-    result = db.query(AnalysisResult).filter(AnalysisResult.id == task_id).first()
+async def get_analysis_status(task_id: str, db: AsyncSession = Depends(get_async_db)):
+    result = await db.get(AnalysisResult, task_id)
     if not result:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -82,14 +336,140 @@ async def get_analysis_status(task_id: str, db: Session = Depends(get_db)):
         "query": result.query,
         "file_name": result.file_name,
         "result": result.result if result.status == "completed" else None,
+        "result_bytes": result.result_bytes if result.status == "completed" else None,
+        "previous_task_id": result.previous_task_id,
+        "changes": result.revision["changes"] if result.revision else None,
         "created_at": result.created_at
     }
 
+@app.get("/status/{task_id}/events")
+async def stream_analysis_status(task_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Server-Sent Events stream of status transitions, agent progress and streamed tokens"""
+    if not await db.get(AnalysisResult, task_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    async def snapshot():
+        async with AsyncSessionLocal() as session:
+            result = await session.get(AnalysisResult, task_id)
+            return {
+                "task_id": task_id,
+                "event": result.status if result else "failed",
+                "result": result.result if result and result.status in TERMINAL_EVENTS else None
+            }
+    
+    async def event_stream():
+        pubsub = async_redis().pubsub()
+        try:
+            # Subscribe before reading the row so no transition falls between the two
+            await pubsub.subscribe(channel(task_id))
+        except RedisError:
+            pubsub = None
+        
+        try:
+            current = await snapshot()
+            yield format_sse("status", current)
+            while current["event"] not in TERMINAL_EVENTS:
+                if await request.is_disconnected():
+                    break
+                
+                if pubsub is None:
+                    # Redis is unavailable; fall back to watching the row
+                    await asyncio.sleep(EVENTS_POLL_INTERVAL)
+                    latest = await snapshot()
+                    if latest["event"] != current["event"]:
+                        yield format_sse("status", latest)
+                    else:
+                        yield ": keep-alive\n\n"
+                    current = latest
+                    continue
+                
+                try:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True,
+                                                       timeout=EVENTS_HEARTBEAT_INTERVAL)
+                except RedisError:
+                    await pubsub.aclose()
+                    pubsub = None
+                    continue
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                event = json.loads(message["data"])
+                yield format_sse(event["event"], event)
+                if event["event"] in TERMINAL_EVENTS:
+                    break
+        finally:
+            if pubsub is not None:
+                await pubsub.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+MAX_RESULTS_PAGE = 100
+
+def encode_cursor(created_at: datetime.datetime, task_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), task_id]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return naive_utc(datetime.datetime.fromisoformat(created_at)), str(task_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def naive_utc(value: datetime.datetime) -> datetime.datetime:
+    """`created_at` is stored as naive UTC; aware datetimes are converted to match"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
 @app.get("/results")
-async def list_results(limit: int = 10, db: Session = Depends(get_db)):
-    results = db.query(AnalysisResult).order_by(
-        AnalysisResult.created_at.desc()
-    ).limit(limit).all()
+async def list_results(
+    limit: int = Query(default=10, ge=1, le=MAX_RESULTS_PAGE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    file_name: Optional[str] = None,
+    created_after: Optional[datetime.datetime] = None,
+    created_before: Optional[datetime.datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List analyses, newest first, one page at a time
+    
+    Pages are keyed on (created_at, id): pass the returned `next_cursor` to get the
+    next page. Filters: exact `status`, case-insensitive `file_name` substring and a
+    `created_after` / `created_before` range.
+    """
+    # Rows without created_at cannot be placed in the (created_at, id) order
+    statement = select(
+        AnalysisResult.id, AnalysisResult.status, AnalysisResult.query,
+        AnalysisResult.file_name, AnalysisResult.created_at
+    ).where(AnalysisResult.created_at.is_not(None))
+    if status:
+        statement = statement.where(AnalysisResult.status == status)
+    if file_name:
+        statement = statement.where(AnalysisResult.file_name.ilike(f"%{escape_like(file_name)}%", escape="\\"))
+    if created_after:
+        statement = statement.where(AnalysisResult.created_at >= naive_utc(created_after))
+    if created_before:
+        statement = statement.where(AnalysisResult.created_at < naive_utc(created_before))
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        statement = statement.where(or_(
+            AnalysisResult.created_at < cursor_created_at,
+            and_(AnalysisResult.created_at == cursor_created_at, AnalysisResult.id < cursor_id),
+        ))
+    
+    # One extra row tells whether another page follows
+    rows = (await db.execute(
+        statement.order_by(AnalysisResult.created_at.desc(), AnalysisResult.id.desc()).limit(limit + 1)
+    )).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
     return {
         "results": [
@@ -100,35 +480,79 @@ async def list_results(limit: int = 10, db: Session = Depends(get_db)):
                 "file_name": r.file_name,
                 "created_at": r.created_at
             }
-            for r in results
-        ]
+            for r in rows
+        ],
+        "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
+        "has_more": has_more
     }
 
+@app.get("/results/{task_id}/content")
+async def get_result_content(task_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Stream the report of a completed analysis
+    
+    Supports single byte ranges (`Range`, `If-Range`) and revalidation with `ETag` /
+    `If-None-Match`. Clients that send a matching `Accept-Encoding` receive the
+    stored compressed bytes with `Content-Encoding` set.
+    """
+    result = await db.get(AnalysisResult, task_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if result.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Analysis is {result.status}")
+    if not result.result_key:
+        raise HTTPException(status_code=404, detail="Result content not available")
+    
+    try:
+        return await run_in_threadpool(
+            content_response, request, result.result_key, result.result_encoding, result.result_bytes
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=410, detail="Result content has expired")
+
 @app.delete("/results/{task_id}")
-async def delete_result(task_id: str, db: Session = Depends(get_db)):
-    result = db.query(AnalysisResult).filter(AnalysisResult.id == task_id).first()
+async def delete_result(task_id: str, db: AsyncSession = Depends(get_async_db)):
+    result = await db.get(AnalysisResult, task_id)
     if not result:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    db.delete(result)
-    db.commit()
+    result_key = result.result_key
+    await db.delete(result)
+    await db.commit()
+    
+    # Deduplicated analyses may share the stored report
+    if result_key and not (await db.execute(
+        select(AnalysisResult.id).where(AnalysisResult.result_key == result_key).limit(1)
+    )).first():
+        await run_in_threadpool(delete_report, result_key)
     return {"message": "Result deleted successfully"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage timings, tokens, cache lookups and task outcomes"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/queue/status")
 async def queue_status():
+    """Queue depths and worker activity from counters the workers keep in Redis"""
     try:
-        active_tasks = celery_app.control.inspect().active()
-        queue_length = celery_app.control.inspect().reserved()
-        return {
-            "active_tasks": active_tasks,
-            "queue_length": queue_length,
-            "broker_url": celery_app.conf.broker_url
-        }
-    except Exception as e:
+        queues, workers = await asyncio.gather(queue_depths(), worker_stats())
+    except RedisError as e:
         return {
             "error": f"Could not fetch queue status: {str(e)}",
             "broker_url": celery_app.conf.broker_url
         }
+    
+    return {
+        "queues": queues,
+        "workers": workers,
+        "totals": {
+            "queued": sum(queue["depth"] for queue in queues.values()),
+            "active": sum(worker["active"] for worker in workers.values()),
+            "reserved": sum(worker["reserved"] for worker in workers.values()),
+            "throughput_per_minute": round(sum(worker["throughput_per_minute"] for worker in workers.values()), 2),
+        },
+        "broker_url": celery_app.conf.broker_url
+    }
 
 if __name__ == "__main__":
     import uvicorn
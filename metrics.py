@@ -0,0 +1,57 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, REGISTRY,
+                               generate_latest, multiprocess)
+
+import tracing
+
+# Prometheus metrics for the API and the workers. When PROMETHEUS_MULTIPROC_DIR is
+# set (and shared by the API and the workers on a host), /metrics aggregates every
+# process; otherwise it only reports the API process.
+MULTIPROCESS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Stages range from milliseconds (DB insert) to minutes (LLM calls, queue wait)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+STAGE_SECONDS = Histogram(
+    "analysis_stage_seconds", "Time spent in each stage of an analysis", ["stage"], buckets=STAGE_BUCKETS
+)
+TOOL_SECONDS = Histogram(
+    "analysis_tool_seconds", "Time spent in agent tool executions", ["tool"], buckets=STAGE_BUCKETS
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens used by agent LLM calls", ["kind"])
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and outcome", ["cache", "result"])
+ANALYSES = Counter("analyses_total", "Analysis task outcomes", ["outcome"])
+INCREMENTAL_ANALYSES = Counter(
+    "incremental_analyses_total", "Completed analyses produced by incremental re-analysis (also counted as completed)"
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a block as `stage` in the stage histogram, with a tracing span when enabled"""
+    start = time.perf_counter()
+    try:
+        with tracing.span(stage):
+            yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def record_usage(usage):
+    """Count the tokens of a crew's usage metrics"""
+    if usage is None:
+        return
+    LLM_TOKENS.labels("prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels("completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+    LLM_TOKENS.labels("cached_prompt").inc(getattr(usage, "cached_prompt_tokens", 0) or 0)
+
+
+def render() -> bytes:
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
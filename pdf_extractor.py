@@ -0,0 +1,202 @@
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pypdf import PdfReader
+
+from extraction_cache import extraction_cache, document_hash, CorruptEntry
+
+logger = logging.getLogger(__name__)
+
+# Page-sharded text extraction. Large documents are split into page ranges that
+# are extracted in a process pool and reassembled in page order.
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "48"))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "16"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_worker_reader = None  # ((path, mtime_ns, size), PdfReader) in pool workers
+
+
+def _page_texts(reader: PdfReader, start: int, end: int) -> list:
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+def extract_page_range(path: str, start: int, end: int) -> list:
+    """Extract the raw text of pages [start, end) of the pdf at `path`
+
+    Runs in pool workers. The parsed reader is kept between calls so a worker
+    handling several shards of the same document only parses it once.
+    """
+    global _worker_reader
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if _worker_reader is None or _worker_reader[0] != key:
+        _worker_reader = (key, PdfReader(path))
+    return _page_texts(_worker_reader[1], start, end)
+
+
+def _shards(total: int, pages_per_shard: int):
+    return [(start, min(start + pages_per_shard, total)) for start in range(0, total, pages_per_shard)]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Return the pool of PDF_EXTRACTION_WORKERS processes shared by every extraction in this process
+
+    Created once; with --pool threads, concurrent tasks submit shards to the same pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn keeps the pool safe to create from threaded parents (uvicorn, crewai)
+            _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACTION_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Drop a broken pool so the next extraction starts a new one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+_warned_daemonic = False
+
+
+def _can_fork_workers() -> bool:
+    """Celery prefork children are daemonic and may not start their own processes"""
+    global _warned_daemonic
+    if not multiprocessing.current_process().daemon:
+        return True
+    if not _warned_daemonic:
+        _warned_daemonic = True
+        logger.warning("PDF extraction runs serially in daemonic (prefork) worker processes; "
+                       "start the worker with --pool threads to extract large documents in parallel")
+    return False
+
+
+def iter_page_shards(path: str, workers: int = None, pages_per_shard: int = None):
+    """Yield lists of raw page text, in page order, one list per shard
+
+    At most `workers` shards of the document are in the shared pool at a time.
+    Documents with fewer than PDF_PARALLEL_MIN_PAGES pages, or when only one
+    worker is available, are read serially in this process.
+    """
+    workers = PDF_EXTRACTION_WORKERS if workers is None else min(workers, PDF_EXTRACTION_WORKERS)
+    pages_per_shard = pages_per_shard or PDF_PAGES_PER_SHARD
+
+    reader = PdfReader(path)
+    total = len(reader.pages)
+    shards = _shards(total, pages_per_shard)
+
+    done = 0
+    if workers > 1 and total >= PDF_PARALLEL_MIN_PAGES and _can_fork_workers():
+        pool = None
+        pending = deque()
+        try:
+            pool = _get_pool()
+            queued = iter(shards)
+            for start, end in islice(queued, workers):
+                pending.append(pool.submit(extract_page_range, path, start, end))
+            # Results are taken in submission order, so pages stay in sequence
+            while pending:
+                shard_pages = pending.popleft().result()
+                following = next(queued, None)
+                if following is not None:
+                    pending.append(pool.submit(extract_page_range, path, *following))
+                yield shard_pages
+                done += 1
+            return
+        except (BrokenProcessPool, OSError, AssertionError):
+            # Finish the remaining shards serially
+            if pool is not None:
+                _discard_pool(pool)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    for start, end in shards[done:]:
+        yield _page_texts(reader, start, end)
+
+
+def extract_pages(path: str, workers: int = None) -> list:
+    """Extract the raw text of every page of the pdf at `path`"""
+    pages = []
+    for shard in iter_page_shards(path, workers=workers):
+        pages.extend(shard)
+    return pages
+
+
+_BLANK_LINES = re.compile(r"\n{2,}")
+
+
+def normalize_page_text(text: str) -> str:
+    """Collapse runs of blank lines in one pass"""
+    return _BLANK_LINES.sub("\n", text)
+
+
+def _iter_raw_pages(path: str):
+    yielded = False
+    try:
+        for shard in iter_page_shards(path):
+            for page in shard:
+                yielded = True
+                yield page
+    except Exception:
+        if yielded:
+            raise
+        # Fallback to PyPDFLoader if pypdf cannot parse the file
+        from langchain_community.document_loaders import PyPDFLoader
+        for doc in PyPDFLoader(path).lazy_load():
+            yield doc.page_content
+
+
+def iter_document_pages(path: str):
+    """Yield the normalized text of each page of the pdf at `path`, in order
+
+    Pages come from the extraction cache when the document has been seen
+    before; otherwise they are extracted shard by shard and written through
+    to the cache as they are yielded. A damaged cache entry is extracted again,
+    picking up after the pages already yielded from it.
+    """
+    key = document_hash(path)
+    served = 0
+    cached = extraction_cache.iter_pages(key)
+    if cached is not None:
+        try:
+            for page in cached:
+                served += 1
+                yield page
+            return
+        except CorruptEntry:
+            pass
+
+    writer = extraction_cache.writer(key)
+    try:
+        for number, page in enumerate(_iter_raw_pages(path)):
+            page = normalize_page_text(page)
+            writer.write(page)
+            if number >= served:
+                yield page
+        writer.commit()
+    finally:
+        # Discards the partial entry if the consumer stopped early or extraction failed
+        writer.abort()
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+
+import redis
+import redis.asyncio as aioredis
+from celery.signals import task_received, task_prerun, task_postrun, task_revoked, worker_ready, worker_shutdown
+
+from celery_app import celery_app, QUEUES, PRIORITY_STEPS, PRIORITY_SEPARATOR, TASK_TIME_LIMIT
+
+# Queue and worker statistics kept in Redis, so /queue/status can answer from a
+# handful of reads instead of broadcasting `inspect` to every worker.
+# Workers maintain them through Celery signals:
+#   queue-stats:workers                 set of worker node names
+#   queue-stats:worker:<node>           hash: active, reserved, succeeded, failed, retried, started_at, last_seen
+#   queue-stats:done:<node>:<minute>    tasks finished by the node in that minute
+# A running worker refreshes its hash every third of WORKER_STATS_TTL, so the
+# hash expires only once the worker is gone. It is reset when the worker starts,
+# so counts left behind by a crash do not linger. The TTL outlasts the longest
+# task, since a busy worker's signals may be that far apart.
+WORKER_STATS_TTL = int(os.getenv("WORKER_STATS_TTL", str(max(600, TASK_TIME_LIMIT + 60))))
+THROUGHPUT_WINDOW_MINUTES = int(os.getenv("THROUGHPUT_WINDOW_MINUTES", "5"))
+
+WORKERS_KEY = "queue-stats:workers"
+
+# Counter decrements never go below zero, e.g. after the hash was reset mid-task
+_CLAMPED_INCRBY = """
+local value = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if value < 0 then
+    redis.call('HSET', KEYS[1], ARGV[1], 0)
+end
+return value
+"""
+
+_client = None
+_sync_client = None
+_clamped_incrby = None
+_refresh_stop = threading.Event()
+
+
+def _redis() -> aioredis.Redis:
+    global _client
+    if _client is None:
+        _client = aioredis.Redis.from_url(celery_app.conf.broker_url)
+    return _client
+
+
+def _sync_redis() -> redis.Redis:
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(celery_app.conf.broker_url)
+    return _sync_client
+
+
+def _clamped_incrby_script():
+    global _clamped_incrby
+    if _clamped_incrby is None:
+        _clamped_incrby = _sync_redis().register_script(_CLAMPED_INCRBY)
+    return _clamped_incrby
+
+
+def worker_key(node: str) -> str:
+    return f"queue-stats:worker:{node}"
+
+
+def done_key(node: str, minute: int) -> str:
+    return f"queue-stats:done:{node}:{minute}"
+
+
+def priority_list(queue: str, priority: int) -> str:
+    """Name of the Redis list holding `queue` messages at `priority` (as kombu names it)"""
+    return f"{queue}{PRIORITY_SEPARATOR}{priority}" if priority else queue
+
+
+# --- worker side ---
+
+def _update(node: str, reset: bool = False, done: bool = False, **increments):
+    """Apply counter changes to a worker's hash in one round-trip; never raises"""
+    if not node:
+        return
+    now = time.time()
+    key = worker_key(node)
+    try:
+        with _sync_redis().pipeline() as pipe:
+            if reset:
+                pipe.delete(key)
+                pipe.hset(key, "started_at", now)
+            for field, amount in increments.items():
+                if amount < 0:
+                    _clamped_incrby_script()(keys=[key], args=[field, amount], client=pipe)
+                else:
+                    pipe.hincrby(key, field, amount)
+            pipe.hset(key, "last_seen", now)
+            pipe.expire(key, WORKER_STATS_TTL)
+            pipe.sadd(WORKERS_KEY, node)
+            if done:
+                minute_key = done_key(node, int(now // 60))
+                pipe.incr(minute_key)
+                pipe.expire(minute_key, (THROUGHPUT_WINDOW_MINUTES + 1) * 60)
+            pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def _refresh(node: str):
+    """Keep the worker's hash alive while it runs, between task signals"""
+    while not _refresh_stop.wait(max(1, WORKER_STATS_TTL // 3)):
+        _update(node)
+
+
+@worker_ready.connect
+def on_worker_ready(sender=None, **kwargs):
+    _update(sender.hostname, reset=True)
+    _refresh_stop.clear()
+    threading.Thread(target=_refresh, args=(sender.hostname,), name="queue-stats-refresh", daemon=True).start()
+
+
+@worker_shutdown.connect
+def on_worker_shutdown(sender=None, **kwargs):
+    _refresh_stop.set()
+    try:
+        _sync_redis().delete(worker_key(sender.hostname))
+        _sync_redis().srem(WORKERS_KEY, sender.hostname)
+    except redis.RedisError:
+        pass
+
+
+@task_received.connect
+def on_task_received(sender=None, request=None, **kwargs):
+    _update(sender.hostname, reserved=1)
+
+
+@task_revoked.connect
+def on_task_revoked(sender=None, request=None, **kwargs):
+    if request is not None:
+        _update(request.hostname, reserved=-1)
+
+
+@task_prerun.connect
+def on_task_prerun(task=None, **kwargs):
+    _update(task.request.hostname, reserved=-1, active=1)
+
+
+@task_postrun.connect
+def on_task_postrun(task=None, state=None, **kwargs):
+    outcome = {"SUCCESS": "succeeded", "RETRY": "retried"}.get(state, "failed")
+    _update(task.request.hostname, done=True, active=-1, **{outcome: 1})
+
+
+# --- API side ---
+
+async def queue_depths() -> dict:
+    """Messages waiting in each queue, in total and per priority step"""
+    async with _redis().pipeline(transaction=False) as pipe:
+        for queue in QUEUES:
+            for priority in PRIORITY_STEPS:
+                pipe.llen(priority_list(queue, priority))
+        lengths = iter(await pipe.execute())
+    depths = {}
+    for queue in QUEUES:
+        by_priority = {priority: next(lengths) for priority in PRIORITY_STEPS}
+        depths[queue] = {"depth": sum(by_priority.values()), "by_priority": by_priority}
+    return depths
+
+
+async def worker_stats() -> dict:
+    """Active and reserved counts, outcomes and recent throughput of each live worker"""
+    client = _redis()
+    nodes = sorted(node.decode() for node in await client.smembers(WORKERS_KEY))
+    if not nodes:
+        return {}
+
+    minute = int(time.time() // 60)
+    async with client.pipeline(transaction=False) as pipe:
+        for node in nodes:
+            pipe.hgetall(worker_key(node))
+            pipe.mget([done_key(node, minute - offset) for offset in range(THROUGHPUT_WINDOW_MINUTES)])
+        replies = await pipe.execute()
+
+    workers = {}
+    expired = []
+    for node, stats, done in zip(nodes, replies[::2], replies[1::2]):
+        if not stats:
+            expired.append(node)
+            continue
+        stats = {field.decode(): value.decode() for field, value in stats.items()}
+        finished = sum(int(count) for count in done if count)
+        workers[node] = {
+            "active": max(0, int(stats.get("active", 0))),
+            "reserved": max(0, int(stats.get("reserved", 0))),
+            "succeeded": int(stats.get("succeeded", 0)),
+            "failed": int(stats.get("failed", 0)),
+            "retried": int(stats.get("retried", 0)),
+            "throughput_per_minute": round(finished / THROUGHPUT_WINDOW_MINUTES, 2),
+            "last_seen": float(stats["last_seen"]),
+        }
+    if expired:
+        await client.srem(WORKERS_KEY, *expired)
+    return workers
@@ -0,0 +1,127 @@
+import math
+import os
+
+import redis.asyncio as aioredis
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
+
+from celery_app import REDIS_URL
+
+# Per-client token buckets in Redis, shared by every API process.
+# One token is one document; buckets refill continuously up to the burst size.
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", REDIS_URL)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "500"))
+# Clients are told apart by address. Behind a gateway that authenticates callers,
+# name the header it sets to the caller's identity; never a header clients set.
+RATE_LIMIT_IDENTITY_HEADER = os.getenv("RATE_LIMIT_IDENTITY_HEADER", "").strip()
+# Uploads charged their first document before the body is read
+RATE_LIMITED_PATHS = ("/analyze", "/analyze/batch")
+
+# Refill, then take `cost` tokens if available. Returns {allowed, retry after seconds, tokens left}.
+_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return {allowed, tostring(retry_after), tostring(tokens)}
+"""
+
+_client = None
+_script = None
+
+
+def _token_bucket():
+    global _client, _script
+    if _script is None:
+        _client = aioredis.Redis.from_url(RATE_LIMIT_REDIS_URL)
+        _script = _client.register_script(_TOKEN_BUCKET)
+    return _script
+
+
+def client_id(request: Request) -> str:
+    """The tenant a request is charged to: the gateway's identity header if configured, else the address"""
+    if RATE_LIMIT_IDENTITY_HEADER:
+        identity = request.headers.get(RATE_LIMIT_IDENTITY_HEADER, "").strip()
+        if identity:
+            return f"id:{identity[:128]}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def _enabled() -> bool:
+    return RATE_LIMIT_ENABLED and RATE_LIMIT_PER_MINUTE > 0
+
+
+async def _take(request: Request, cost: int) -> int:
+    """Take `cost` tokens from the client's bucket; returns 0, or the seconds to wait
+
+    Fails open: if Redis is unreachable the request is let through.
+    """
+    try:
+        allowed, retry_after, _ = await _token_bucket()(
+            keys=[f"rate-limit:{client_id(request)}"],
+            args=[RATE_LIMIT_PER_MINUTE / 60.0, RATE_LIMIT_BURST, cost],
+        )
+    except RedisError:
+        return 0
+    return 0 if int(allowed) else max(1, math.ceil(float(retry_after)))
+
+
+async def enforce_rate_limit(request: Request, cost: int = 1, prepaid: int = 0):
+    """Charge `cost` documents, less the `prepaid` ones, to the client's bucket or raise a 429"""
+    if not _enabled():
+        return
+    if cost > RATE_LIMIT_BURST:
+        raise HTTPException(status_code=429, detail=f"Request exceeds the {RATE_LIMIT_BURST} document burst limit")
+    if cost <= prepaid:
+        return
+    retry_after = await _take(request, cost - prepaid)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded; retry in {retry_after} s",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class RateLimitMiddleware:
+    """Charge one document for each upload before its body is read
+
+    A client with an empty bucket is refused without receiving the upload. The
+    rest of a batch's cost is charged once its files are counted
+    (`enforce_rate_limit(..., prepaid=1)`).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] == "http" and scope["method"] == "POST"
+                and scope["path"] in RATE_LIMITED_PATHS and _enabled()):
+            retry_after = await _take(Request(scope), 1)
+            if retry_after:
+                response = JSONResponse(
+                    status_code=429,
+                    content={"detail": f"Rate limit exceeded; retry in {retry_after} s"},
+                    headers={"Retry-After": str(retry_after)},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,309 @@
+import datetime
+import os
+import re
+import uuid
+import zlib
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+# Analysis reports are compressed and kept in a result store, either a local
+# directory or an S3-compatible bucket (AWS S3, MinIO, ...), and served by the API
+# from /results/{task_id}/content. The database only records the object key, the
+# stored encoding and the report's size, so API and workers need no shared disk.
+RESULT_STORE_BACKEND = os.getenv("RESULT_STORE_BACKEND", "local").lower()  # local | s3
+RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR", "outputs")
+RESULT_S3_BUCKET = os.getenv("RESULT_S3_BUCKET", "analysis-results")
+RESULT_S3_PREFIX = os.getenv("RESULT_S3_PREFIX", "")
+RESULT_S3_ENDPOINT_URL = os.getenv("RESULT_S3_ENDPOINT_URL")  # e.g. http://localhost:9000 for MinIO
+RESULT_COMPRESSION = os.getenv("RESULT_COMPRESSION", "zstd").lower()  # zstd | gzip | identity
+RESULT_COMPRESSION_LEVEL = int(os.getenv("RESULT_COMPRESSION_LEVEL", "6"))
+RESULT_RETENTION_DAYS = float(os.getenv("RESULT_RETENTION_DAYS", "30"))  # 0 keeps results forever
+RESULT_CHUNK_SIZE = 64 * 1024
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SUFFIXES = {"zstd": ".zst", "gzip": ".gz", "identity": ""}
+CONTENT_TYPE = "text/plain; charset=utf-8"
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def storage_encoding(preferred: str = RESULT_COMPRESSION) -> str:
+    """The configured encoding, falling back to gzip when zstandard is not installed"""
+    if preferred == "zstd" and zstandard is None:
+        return "gzip"
+    return preferred if preferred in SUFFIXES else "gzip"
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=RESULT_COMPRESSION_LEVEL).compress(data)
+    if encoding == "gzip":
+        compressor = zlib.compressobj(RESULT_COMPRESSION_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+        return compressor.compress(data) + compressor.flush()
+    return data
+
+
+def decompress_chunks(chunks, encoding: str):
+    """Decompress an iterable of stored chunks incrementally"""
+    if encoding == "identity":
+        yield from chunks
+        return
+    decompressor = zstandard.ZstdDecompressor().decompressobj() if encoding == "zstd" else zlib.decompressobj(31)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def slice_chunks(chunks, start: int, end: int):
+    """Yield bytes start..end (inclusive) of a chunk stream, dropping the rest"""
+    position = 0
+    for chunk in chunks:
+        chunk_end = position + len(chunk)
+        if chunk_end > start:
+            yield chunk[max(0, start - position):end + 1 - position]
+        position = chunk_end
+        if position > end:
+            return
+
+
+class LocalBackend:
+    """Objects are files under a directory, written atomically"""
+
+    def __init__(self, root: str = RESULT_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def put(self, key: str, data: bytes, encoding: str):
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def stat(self, key: str) -> dict:
+        """Size and a version tag of the object; FileNotFoundError when it is gone"""
+        info = os.stat(self._path(key))
+        return {"size": info.st_size, "version": f"{info.st_size:x}-{info.st_mtime_ns:x}"}
+
+    def read(self, key: str, start: int = 0, end: int = None):
+        """Yield the stored bytes start..end (inclusive) in chunks"""
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end + 1 - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(RESULT_CHUNK_SIZE if remaining is None else min(RESULT_CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def expired(self, cutoff: datetime.datetime):
+        """Keys of objects last written before `cutoff` (UTC)"""
+        cutoff_timestamp = cutoff.replace(tzinfo=datetime.timezone.utc).timestamp()
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(".part") and entry.stat().st_mtime < cutoff_timestamp:
+                    yield entry.name
+
+
+class S3Backend:
+    """Objects in an S3-compatible bucket; needs boto3"""
+
+    def __init__(self, bucket: str = RESULT_S3_BUCKET, prefix: str = RESULT_S3_PREFIX,
+                 endpoint_url: str = RESULT_S3_ENDPOINT_URL):
+        import boto3
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def put(self, key: str, data: bytes, encoding: str):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data, ContentType=CONTENT_TYPE,
+                               **({"ContentEncoding": encoding} if encoding != "identity" else {}))
+
+    def stat(self, key: str) -> dict:
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(key) from e
+            raise
+        return {"size": head["ContentLength"], "version": head["ETag"].strip('"')}
+
+    def read(self, key: str, start: int = 0, end: int = None):
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        body = self.client.get_object(Bucket=self.bucket, Key=self.prefix + key, Range=byte_range)["Body"]
+        try:
+            yield from body.iter_chunks(RESULT_CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def expired(self, cutoff: datetime.datetime):
+        cutoff = cutoff.replace(tzinfo=datetime.timezone.utc)
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                if item["LastModified"] < cutoff:
+                    yield item["Key"][len(self.prefix):]
+
+
+BACKENDS = {"local": LocalBackend, "s3": S3Backend}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[RESULT_STORE_BACKEND]()
+    return _backend
+
+
+def save_report(task_id: str, text: str) -> dict:
+    """Compress and store a report; returns the columns that locate it"""
+    encoding = storage_encoding()
+    key = f"analysis_{task_id}.txt{SUFFIXES[encoding]}"
+    data = text.encode("utf-8")
+    get_backend().put(key, compress(data, encoding), encoding)
+    return {"result_key": key, "result_encoding": encoding, "result_bytes": len(data)}
+
+
+def load_report(key: str, encoding: str) -> str:
+    """The whole text of a stored report; FileNotFoundError when it is gone"""
+    backend = get_backend()
+    backend.stat(key)
+    return b"".join(decompress_chunks(backend.read(key), encoding or "identity")).decode("utf-8")
+
+
+def delete_report(key: str):
+    get_backend().delete(key)
+
+
+def expired_reports(cutoff: datetime.datetime):
+    return get_backend().expired(cutoff)
+
+
+def content_url(task_id: str) -> str:
+    return f"/results/{task_id}/content"
+
+
+# --- HTTP ---
+
+def _quality(params: str) -> float:
+    """The q-value of an Accept-Encoding item; missing or unparseable counts as 1"""
+    for param in params.split(";"):
+        name, _, value = param.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 1.0
+    return 1.0
+
+
+def accepts_encoding(header: str, encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows `encoding` (q=0 refuses it)
+
+    An entry naming the encoding takes precedence over "*".
+    """
+    wildcard = None
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if name == encoding:
+            return _quality(params) != 0
+        if name == "*" and wildcard is None:
+            wildcard = _quality(params) != 0
+    return bool(wildcard)
+
+
+def parse_range(header: str, size: int):
+    """(start, end) of a single-range Range header, None to serve the whole body
+
+    Multiple ranges are not supported and fall back to the whole body. Raises 416
+    for a range that lies outside the content.
+    """
+    match = _RANGE.match((header or "").replace(" ", ""))
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    candidates = [tag.strip().removeprefix("W/") for tag in (header or "").split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def content_response(request: Request, key: str, encoding: str, size: int = None) -> Response:
+    """Stream a stored report, honouring Range, If-Range and If-None-Match
+
+    Clients that accept the stored encoding get the compressed bytes as stored,
+    with Content-Encoding set, so the report is never decompressed on the way out.
+    Others get it decompressed on the fly. Either way it is read chunk by chunk.
+    Raises FileNotFoundError when the object is gone.
+    """
+    backend = get_backend()
+    stored = backend.stat(key)
+    passthrough = encoding == "identity" or accepts_encoding(request.headers.get("accept-encoding"), encoding)
+    length = stored["size"] if passthrough else size
+    etag = f'"{stored["version"]}"' if encoding == "identity" or not passthrough else f'"{stored["version"]}.{encoding}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if passthrough and encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if length is not None and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_range(request.headers.get("range"), length)
+
+    if passthrough:
+        start, end = byte_range or (0, length - 1)
+        body = backend.read(key, start, end) if length else iter(())
+    elif byte_range:
+        start, end = byte_range
+        body = slice_chunks(decompress_chunks(backend.read(key), encoding), start, end)
+    else:
+        # Decompressed size is not sent, so the body goes out chunked
+        return StreamingResponse(decompress_chunks(backend.read(key), encoding), media_type=CONTENT_TYPE,
+                                 headers=headers)
+
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1 if length else 0)
+    return StreamingResponse(body, status_code=206 if byte_range else 200, media_type=CONTENT_TYPE, headers=headers)
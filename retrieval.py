@@ -0,0 +1,191 @@
+import gzip
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from extraction_cache import document_hash
+from pdf_extractor import iter_document_pages
+
+# Lexical retrieval over document chunks, so the analyst only sees the parts
+# of a filing relevant to the query instead of the whole text.
+INDEX_DIR = os.getenv("RETRIEVAL_INDEX_DIR", ".cache/retrieval")
+CHUNK_TOKENS = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", "300"))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "3000"))
+LOADED_INDEXES = 8
+
+CHARS_PER_TOKEN = 4  # rough estimate for English prose and figures
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.,]\d+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "what which how who our we you your".split()
+)
+_HEADING = re.compile(r"^[A-Z][A-Za-z&,'()/\- ]{2,80}$")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def tokenize(text: str) -> list:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def chunk_pages(pages, chunk_tokens: int = CHUNK_TOKENS):
+    """Split page texts into section-labelled chunks of about `chunk_tokens` tokens
+
+    Chunks never span pages. A short title-like line starts a new section,
+    and the section heading is carried onto the chunks that follow it.
+    """
+    chunk_chars = chunk_tokens * CHARS_PER_TOKEN
+    section = ""
+    for page_number, page in enumerate(pages, start=1):
+        lines = []
+        size = 0
+        for line in page.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            is_heading = bool(_HEADING.match(line)) and len(line.split()) <= 8
+            if lines and (size + len(line) > chunk_chars or is_heading):
+                yield {"page": page_number, "section": section, "text": "\n".join(lines)}
+                lines = []
+                size = 0
+            if is_heading:
+                section = line
+            lines.append(line)
+            size += len(line) + 1
+        if lines:
+            yield {"page": page_number, "section": section, "text": "\n".join(lines)}
+
+
+class DocumentIndex:
+    """BM25 index over the chunks of one document"""
+
+    def __init__(self, chunks: list, postings: dict, lengths):
+        self.chunks = chunks
+        self.postings = postings  # term -> (chunk ids, term frequencies)
+        self.lengths = np.asarray(lengths, dtype=float)
+        self.average_length = float(self.lengths.mean()) if len(self.lengths) and self.lengths.any() else 1.0
+
+    @classmethod
+    def build(cls, pages, chunk_tokens: int = CHUNK_TOKENS) -> "DocumentIndex":
+        chunks = []
+        lengths = []
+        postings = {}
+        for chunk_id, chunk in enumerate(chunk_pages(pages, chunk_tokens)):
+            tokens = tokenize(f"{chunk['section']}\n{chunk['text']}")
+            chunks.append(chunk)
+            lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                ids, frequencies = postings.setdefault(term, ([], []))
+                ids.append(chunk_id)
+                frequencies.append(frequency)
+        postings = {term: (np.asarray(ids, dtype=np.int32), np.asarray(frequencies, dtype=float))
+                    for term, (ids, frequencies) in postings.items()}
+        return cls(chunks, postings, lengths)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.chunks))
+        total = len(self.chunks)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids, frequencies = posting
+            idf = math.log(1 + (total - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[ids] / self.average_length)
+            scores[ids] += idf * frequencies * (BM25_K1 + 1) / (frequencies + norm)
+        return scores
+
+    def search(self, query: str, top_k: int = TOP_K, token_budget: int = TOKEN_BUDGET) -> list:
+        """Return the best chunks for `query` that fit in `token_budget`, in document order"""
+        if not self.chunks:
+            return []
+        scores = self.scores(query)
+        if scores.any():
+            ranked = [chunk_id for chunk_id in np.argsort(-scores, kind="stable") if scores[chunk_id] > 0]
+        else:
+            # Nothing matched; fall back to the start of the document
+            ranked = list(range(len(self.chunks)))
+
+        selected = []
+        used = 0
+        for chunk_id in ranked:
+            if len(selected) >= top_k:
+                break
+            cost = estimate_tokens(self.chunks[chunk_id]["text"])
+            if used + cost > token_budget:
+                continue
+            selected.append(int(chunk_id))
+            used += cost
+        return [dict(self.chunks[chunk_id], score=float(scores[chunk_id])) for chunk_id in sorted(selected)]
+
+    # --- persistence ---
+
+    def save(self, path: str):
+        data = {
+            "chunks": self.chunks,
+            "lengths": self.lengths.astype(int).tolist(),
+            "postings": {term: [ids.tolist(), frequencies.astype(int).tolist()]
+                         for term, (ids, frequencies) in self.postings.items()},
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=3) as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "DocumentIndex":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        postings = {term: (np.asarray(ids, dtype=np.int32), np.asarray(frequencies, dtype=float))
+                    for term, (ids, frequencies) in data["postings"].items()}
+        return cls(data["chunks"], postings, data["lengths"])
+
+
+_loaded = OrderedDict()  # (sha256, chunk tokens) -> DocumentIndex
+_loaded_lock = threading.Lock()
+
+
+def get_document_index(path: str, chunk_tokens: int = CHUNK_TOKENS) -> DocumentIndex:
+    """Return the index for the pdf at `path`, building and persisting it on first use"""
+    key = (document_hash(path), chunk_tokens)
+    with _loaded_lock:
+        index = _loaded.get(key)
+        if index is not None:
+            _loaded.move_to_end(key)
+            return index
+
+    index_path = os.path.join(INDEX_DIR, f"{key[0]}.{chunk_tokens}.json.gz")
+    try:
+        index = DocumentIndex.load(index_path)
+    except (OSError, ValueError, KeyError):
+        index = DocumentIndex.build(iter_document_pages(path), chunk_tokens)
+        try:
+            index.save(index_path)
+        except OSError:
+            pass
+
+    with _loaded_lock:
+        _loaded[key] = index
+        while len(_loaded) > LOADED_INDEXES:
+            _loaded.popitem(last=False)
+    return index
+
+
+def format_chunks(chunks: list) -> str:
+    parts = []
+    for chunk in chunks:
+        section = f" | {chunk['section']}" if chunk["section"] else ""
+        parts.append(f"[Page {chunk['page']}{section}]\n{chunk['text']}")
+    return "\n\n".join(parts)
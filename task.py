@@ -1,123 +1,164 @@
 ## Importing libraries and files
-from crewai import Task
-from agents import financial_analyst, verifier, investment_advisor, risk_assessor
-from crewai_tools import SerperDevTool
-from tools import read_financial_document, analyze_investment, assess_risk
-
-# Create search tool instance
-search_tool = SerperDevTool()
-
-## Creating a task to analyze financial documents
-analyze_financial_document = Task(
-    description="""
-    Analyze the financial document provided at the file path and respond to the user's query: {query}
+from functools import lru_cache
+from agents import get_agents, get_search_tool
+
+def build_tasks(agents: dict) -> dict:
+    """Create the tasks for a set of agents from agents.build_agents()"""
+    # crewai and the tools are imported on first use, like in agents.py
+    from crewai import Task
+    from tools import read_financial_document, search_financial_document, extract_financial_metrics, analyze_investment, assess_risk
+    financial_analyst = agents["financial_analyst"]
+    verifier = agents["verifier"]
+    investment_advisor = agents["investment_advisor"]
+    risk_assessor = agents["risk_assessor"]
+    
+    # Shared search tool instance
+    search_tool = get_search_tool()
+
+    ## Creating a task to analyze financial documents
+    analyze_financial_document = Task(
+        description="""
+        Analyze the financial document provided at the file path and respond to the user's query: {query}
     
-    Your analysis should include:
-    1. Extract and summarize key financial metrics from the document
-    2. Identify important trends and patterns in the financial data
-    3. Assess the financial health and performance of the entity
-    4. Provide relevant market context using current information
-    5. Address the specific query asked by the user
+        Your analysis should include:
+        1. Extract and summarize key financial metrics from the document
+        2. Identify important trends and patterns in the financial data
+        3. Assess the financial health and performance of the entity
+        4. Provide relevant market context using current information
+        5. Address the specific query asked by the user
     
-    Use the financial document reading tool to extract data from: {file_path}
-    Search for current market information if relevant to provide context.
-    """,
-
-    expected_output="""
-    A comprehensive financial analysis report containing:
-    - Executive Summary of key findings
-    - Detailed analysis of financial metrics and ratios
-    - Identification of strengths, weaknesses, and opportunities
-    - Market context and industry comparison
-    - Direct response to the user's specific query
-    - Professional recommendations based on the analysis
+        Use the document search tool on {file_path} to retrieve the sections relevant to the query;
+        search again with more specific topics rather than reading the whole document.
+        Use the financial metrics tool on the same file for the line items and ratios per period
+        instead of re-reading figures from the raw text.
+        Search for current market information if relevant to provide context.
+        """,
+
+        expected_output="""
+        A comprehensive financial analysis report containing:
+        - Executive Summary of key findings
+        - Detailed analysis of financial metrics and ratios
+        - Identification of strengths, weaknesses, and opportunities
+        - Market context and industry comparison
+        - Direct response to the user's specific query
+        - Professional recommendations based on the analysis
     
-    All recommendations should be backed by data from the document and include appropriate disclaimers.
-    """,
-
-    agent=financial_analyst,
-    tools=[read_financial_document, search_tool],
-    async_execution=False,
-)
-
-## Creating an investment analysis task
-investment_analysis = Task(
-    description="""
-    Based on the financial document analysis, provide investment recommendations for: {query}
+        All recommendations should be backed by data from the document and include appropriate disclaimers.
+        """,
+
+        agent=financial_analyst,
+        tools=[search_financial_document, extract_financial_metrics, search_tool],
+        async_execution=False,
+    )
+
+    ## Creating an investment analysis task
+    investment_analysis = Task(
+        description="""
+        Based on the financial document analysis, provide investment recommendations for: {query}
     
-    Your analysis should:
-    1. Review the financial health and performance metrics
-    2. Assess investment potential and risks
-    3. Compare with industry benchmarks and market conditions
-    4. Provide specific, actionable investment recommendations
-    5. Include appropriate risk warnings and disclaimers
-    """,
-
-    expected_output="""
-    A structured investment recommendation report including:
-    - Investment thesis based on financial analysis
-    - Specific investment recommendations with rationale
-    - Risk assessment for each recommendation
-    - Portfolio allocation suggestions if applicable
-    - Timeline and monitoring recommendations
-    - Important disclaimers and risk warnings
-    """,
-
-    agent=investment_advisor,
-    tools=[analyze_investment, search_tool],
-    async_execution=False,
-)
-
-## Creating a risk assessment task
-risk_assessment = Task(
-    description="""
-    Conduct a comprehensive risk assessment based on the financial document and user query: {query}
+        Extracted financials and document excerpts:
+        {document_context}
+    
+        Document verification report:
+        {verification_report}
+    
+        Your analysis should:
+        1. Review the financial health and performance metrics
+        2. Assess investment potential and risks
+        3. Compare with industry benchmarks and market conditions
+        4. Provide specific, actionable investment recommendations
+        5. Include appropriate risk warnings and disclaimers
+        """,
+
+        expected_output="""
+        A structured investment recommendation report including:
+        - Investment thesis based on financial analysis
+        - Specific investment recommendations with rationale
+        - Risk assessment for each recommendation
+        - Portfolio allocation suggestions if applicable
+        - Timeline and monitoring recommendations
+        - Important disclaimers and risk warnings
+        """,
+
+        agent=investment_advisor,
+        tools=[analyze_investment, search_tool],
+        async_execution=False,
+    )
+
+    ## Creating a risk assessment task
+    risk_assessment = Task(
+        description="""
+        Conduct a comprehensive risk assessment based on the financial document and user query: {query}
     
-    Your assessment should:
-    1. Identify key financial and operational risks
-    2. Quantify risks where possible using financial ratios
-    3. Assess market and industry-specific risks
-    4. Provide risk mitigation strategies
-    5. Create a risk matrix or scoring system
-    """,
-
-    expected_output="""
-    A detailed risk assessment report containing:
-    - Risk identification and categorization
-    - Risk quantification and scoring
-    - Impact and probability analysis
-    - Risk mitigation strategies and recommendations
-    - Monitoring and review procedures
-    - Risk tolerance recommendations
-    """,
-
-    agent=risk_assessor,
-    tools=[assess_risk, search_tool],
-    async_execution=False,
-)
-
-## Creating a document verification task
-verification = Task(
-    description="""
-    Verify the financial document provided and ensure it contains valid financial information.
+        Extracted financials and document excerpts:
+        {document_context}
     
-    Your verification should:
-    1. Confirm the document is readable and contains financial data
-    2. Validate key financial statements are present
-    3. Check for data consistency and completeness
-    4. Identify any potential issues or missing information
-    """,
-
-    expected_output="""
-    A verification report stating:
-    - Document type and format confirmation
-    - Summary of financial information found
-    - Data quality and completeness assessment
-    - Any issues or concerns identified
-    - Recommendations for additional information if needed
-    """,
-
-    agent=verifier,
-    tools=[read_financial_document],
-    async_execution=False
-)
\ No newline at end of file
+        Document verification report:
+        {verification_report}
+    
+        Your assessment should:
+        1. Identify key financial and operational risks
+        2. Quantify risks where possible using financial ratios
+        3. Assess market and industry-specific risks
+        4. Provide risk mitigation strategies
+        5. Create a risk matrix or scoring system
+        """,
+
+        expected_output="""
+        A detailed risk assessment report containing:
+        - Risk identification and categorization
+        - Risk quantification and scoring
+        - Impact and probability analysis
+        - Risk mitigation strategies and recommendations
+        - Monitoring and review procedures
+        - Risk tolerance recommendations
+        """,
+
+        agent=risk_assessor,
+        tools=[assess_risk, search_tool],
+        async_execution=False,
+    )
+
+    ## Creating a document verification task
+    verification = Task(
+        description="""
+        Verify the financial document at {file_path} and ensure it contains valid financial information.
+    
+        Your verification should:
+        1. Confirm the document is readable and contains financial data
+        2. Validate key financial statements are present
+        3. Check for data consistency and completeness
+        4. Identify any potential issues or missing information
+        """,
+
+        expected_output="""
+        A verification report stating:
+        - Document type and format confirmation
+        - Summary of financial information found
+        - Data quality and completeness assessment
+        - Any issues or concerns identified
+        - Recommendations for additional information if needed
+        """,
+
+        agent=verifier,
+        tools=[read_financial_document],
+        async_execution=False
+    )
+
+    return {
+        "analyze_financial_document": analyze_financial_document,
+        "investment_analysis": investment_analysis,
+        "risk_assessment": risk_assessment,
+        "verification": verification,
+    }
+
+@lru_cache(maxsize=None)
+def get_tasks() -> dict:
+    """The tasks for the default agents of this process"""
+    return build_tasks(get_agents())
+
+def __getattr__(name):
+    # Keeps `from task import verification` working without building at import time
+    if name in ("analyze_financial_document", "investment_analysis", "risk_assessment", "verification"):
+        return get_tasks()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
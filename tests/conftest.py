@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# Keep the extraction cache out of the working tree
+os.environ.setdefault("EXTRACTION_CACHE_DIR", tempfile.mkdtemp(prefix="test-extraction-cache-"))
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from celery.result import AsyncResult
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+import main
+import rate_limit
+import uploads
+from database.models import Base, get_async_db
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """The API on a fresh SQLite database, with queueing recorded instead of sent"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'api.db'}")
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    asyncio.run(create_tables())
+
+    async def get_db():
+        async with sessions() as db:
+            yield db
+
+    queued = []
+
+    def send_task(name, args, task_id, **kwargs):
+        queued.append(task_id)
+        return AsyncResult(task_id)
+
+    monkeypatch.setattr(main.celery_app, "send_task", send_task)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", False)
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    main.app.dependency_overrides[get_async_db] = get_db
+    client = TestClient(main.app)
+    client.queued = queued
+    yield client
+    main.app.dependency_overrides.clear()
+
+
+def submit(client, force=False):
+    return client.post("/analyze", files={"file": ("filing.pdf", b"%PDF-1.4 same bytes", "application/pdf")},
+                       data={"query": "Summarize revenue", "force": str(force).lower()}).json()
+
+
+def test_identical_submissions_racing_past_the_lookup_share_one_task(client, monkeypatch):
+    first = submit(client)
+    lookup = main.find_reusable_analysis
+    lookups = []
+
+    async def racing_lookup(db, fingerprint):
+        # The second request looked before the first one was committed
+        lookups.append(fingerprint)
+        return None if len(lookups) == 1 else await lookup(db, fingerprint)
+
+    monkeypatch.setattr(main, "find_reusable_analysis", racing_lookup)
+    second = submit(client)
+
+    assert second["deduplicated"] is True
+    assert second["task_id"] == first["task_id"]
+    assert client.queued == [first["task_id"]]
+
+
+def test_forced_submissions_are_queued_alongside_one_in_flight(client):
+    first = submit(client)
+    forced = submit(client, force=True)
+
+    assert forced["task_id"] != first["task_id"]
+    assert client.queued == [first["task_id"], forced["task_id"]]
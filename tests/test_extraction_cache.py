@@ -0,0 +1,55 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from extraction_cache import ExtractionCache, extraction_cache, document_hash
+from pdf_extractor import iter_document_pages
+from synthetic_pdf import write_pdf
+
+
+@pytest.fixture
+def cached_pdf(tmp_path):
+    """A PDF whose pages are in the disk tier only, and the path of that entry"""
+    path = write_pdf(str(tmp_path / "filing.pdf"), 5)
+    pages = list(iter_document_pages(path))
+    extraction_cache.clear()
+    entry = extraction_cache._disk_path(document_hash(path))
+    assert os.path.exists(entry)
+    return path, pages, entry
+
+
+def test_truncated_entry_is_extracted_again(cached_pdf):
+    path, pages, entry = cached_pdf
+    with open(entry, "rb") as f:
+        data = f.read()
+    with open(entry, "wb") as f:
+        f.write(data[:len(data) // 2])
+
+    assert list(iter_document_pages(path)) == pages
+    extraction_cache.clear()
+    assert extraction_cache.get(document_hash(path)) == pages
+
+
+def test_garbage_line_resumes_after_the_pages_already_read(cached_pdf):
+    path, pages, entry = cached_pdf
+    with gzip.open(entry, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(pages[0]) + "\n")
+        f.write(json.dumps(pages[1]) + "\n")
+        f.write("{not json\n")
+
+    assert list(iter_document_pages(path)) == pages
+    extraction_cache.clear()
+    assert extraction_cache.get(document_hash(path)) == pages
+
+
+def test_damaged_entry_is_a_miss_for_get(tmp_path):
+    cache = ExtractionCache(cache_dir=str(tmp_path))
+    cache.put("key", ["one", "two"])
+    cache.clear()
+    with open(cache._disk_path("key"), "wb") as f:
+        f.write(b"\x1f\x8b\x08\x00garbage")
+
+    assert cache.get("key") is None
+    assert not os.path.exists(cache._disk_path("key"))
@@ -0,0 +1,130 @@
+import zlib
+
+from incremental import align_pages, diff_sections, document_sections, key_sections, page_fingerprints, section_outline
+from pdf_extractor import iter_document_pages
+
+
+def write_objects(path, objects):
+    """Write a PDF whose object n is objects[n - 1]; object 1 is the catalog"""
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    path.write_bytes(bytes(out))
+    return str(path)
+
+
+def stream(data: bytes, entries: bytes = b"") -> bytes:
+    return b"<< %s /Length %d >>\nstream\n%s\nendstream" % (entries, len(data), data)
+
+
+def form_xobject_pdf(path, text: str):
+    """One page whose content stream only paints a Form XObject holding the text"""
+    return write_objects(path, [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+        b"/Resources << /XObject << /Fm0 5 0 R >> >> /Contents 4 0 R >>",
+        stream(b"q /Fm0 Do Q"),
+        stream(b"BT /F1 12 Tf 40 800 Td (%s) Tj ET" % text.encode(),
+               b"/Type /XObject /Subtype /Form /BBox [0 0 612 842] /Resources << /Font << /F1 6 0 R >> >>"),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ])
+
+
+def scanned_pdf(path, pixels: bytes):
+    """One page that only paints an image, as a scanner produces"""
+    return write_objects(path, [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+        b"/Resources << /XObject << /Im0 5 0 R >> >> /Contents 4 0 R >>",
+        stream(b"q 612 0 0 842 0 0 cm /Im0 Do Q"),
+        stream(zlib.compress(pixels), b"/Type /XObject /Subtype /Image /Width 2 /Height 2 "
+                                      b"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode"),
+    ])
+
+
+def test_form_xobject_text_change_changes_the_page(tmp_path):
+    original = form_xobject_pdf(tmp_path / "original.pdf", "Net income 100")
+    restated = form_xobject_pdf(tmp_path / "restated.pdf", "Net income 999 restated")
+    assert "999" in next(iter_document_pages(restated))
+
+    old, new = page_fingerprints(original), page_fingerprints(restated)
+
+    assert old != new
+    assert align_pages(old, new)["changed"] == [0]
+
+
+def test_scanned_page_image_change_changes_the_page(tmp_path):
+    first = scanned_pdf(tmp_path / "first.pdf", b"\x00\xff\xff\x00")
+    second = scanned_pdf(tmp_path / "second.pdf", b"\xff\x00\x00\xff")
+
+    assert page_fingerprints(first) != page_fingerprints(second)
+
+
+def test_streams_with_unknown_filters_are_fingerprinted(tmp_path):
+    path = write_objects(tmp_path / "odd.pdf", [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+        b"/Resources << /XObject << /Im0 5 0 R >> >> /Contents 4 0 R >>",
+        stream(b"q 612 0 0 842 0 0 cm /Im0 Do Q"),
+        stream(b"\x00\xff\xff\x00", b"/Type /XObject /Subtype /Image /Width 2 /Height 2 "
+                                  b"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FooDecode"),
+    ])
+    assert list(iter_document_pages(path)) == [""]
+
+    fingerprints = page_fingerprints(path)
+
+    assert fingerprints is not None and len(fingerprints) == 1
+
+
+def test_identical_pages_keep_their_fingerprints(tmp_path):
+    first = form_xobject_pdf(tmp_path / "first.pdf", "Net income 100")
+    second = form_xobject_pdf(tmp_path / "second.pdf", "Net income 100")
+
+    assert page_fingerprints(first) == page_fingerprints(second)
+
+
+def section_page(title, figure):
+    return f"{title}\nTotal assets were ${figure} million at year end.\nNet income was ${figure // 10} million."
+
+
+def test_inserted_heading_does_not_rename_later_sections():
+    original = [
+        section_page("Revenue Overview", 900),
+        section_page("Balance Sheet", 1200),
+        section_page("Notes to the Statements", 300),
+        section_page("Balance Sheet", 1500),
+        section_page("Risk Factors", 50),
+    ]
+    revised = original[:1] + [section_page("Balance Sheet", 1300), section_page("Segment Data", 400)] + original[1:]
+    revised[5] = section_page("Balance Sheet", 1600)
+
+    old = key_sections(document_sections(original))
+    new = key_sections(document_sections(revised), old)
+
+    assert list(old) == ["Revenue Overview", "Balance Sheet", "Notes to the Statements", "Balance Sheet (2)",
+                         "Risk Factors"]
+    assert new["Balance Sheet"]["text"] == old["Balance Sheet"]["text"]
+    assert diff_sections(old, new) == {
+        "modified": ["Balance Sheet (2)"],
+        "added": ["Balance Sheet (3)", "Segment Data"],
+        "removed": [],
+    }
+
+
+def test_outline_restores_keys_of_an_earlier_revision():
+    pages = [section_page("Balance Sheet", 1), section_page("Cash Flow", 2), section_page("Balance Sheet", 3)]
+    outline = [["Balance Sheet (3)", "Balance Sheet"], ["Cash Flow", "Cash Flow"], ["Balance Sheet", "Balance Sheet"]]
+
+    keyed = key_sections(document_sections(pages), outline)
+
+    assert section_outline(keyed) == outline
@@ -0,0 +1,66 @@
+import json
+import shutil
+import uuid
+
+import pytest
+
+import llm_cache
+from synthetic_pdf import write_pdf
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    """Two uploads of the same PDF, under their random upload names"""
+    first = write_pdf(str(tmp_path / f"financial_document_{uuid.uuid4()}.pdf"), 2)
+    second = str(tmp_path / f"financial_document_{uuid.uuid4()}.pdf")
+    shutil.copyfile(first, second)
+    return first, second
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """A CachedLLM whose model answers with a ReAct turn reading the prompt's document"""
+    llm_cache.response_cache.clear()
+    calls = []
+
+    def call(self, messages, **kwargs):
+        path = llm_cache._UPLOAD_PATH.search(llm_cache.message_text(messages)).group(0)
+        calls.append(path)
+        return f"Action: read_financial_document\nAction Input: {json.dumps({'path': path})}"
+
+    monkeypatch.setattr(llm_cache.LLM, "call", call)
+    return llm_cache.CachedLLM(model="gpt-4", temperature=0), calls
+
+
+def prompt(path):
+    return [{"role": "user", "content": f"Analyze the financial document at {path}"}]
+
+
+def test_same_document_uploaded_twice_hits_with_current_path(llm, uploads):
+    llm, calls = llm
+    first, second = uploads
+    assert first in llm.call(prompt(first))
+    # The first upload is deleted when its analysis finishes
+    llm_cache.os.remove(first)
+
+    response = llm.call(prompt(second))
+
+    assert calls == [first]
+    assert second in response and first not in response
+
+
+def test_missing_upload_does_not_share_a_key(uploads, tmp_path):
+    first, _ = uploads
+    missing = str(tmp_path / f"financial_document_{uuid.uuid4()}.pdf")
+    other = str(tmp_path / f"financial_document_{uuid.uuid4()}.pdf")
+
+    assert llm_cache.normalize_text(missing) != llm_cache.normalize_text(other)
+    assert llm_cache.normalize_text(first).startswith("<document:")
+
+
+def test_token_for_document_not_in_prompt_is_a_miss(uploads):
+    first, second = uploads
+    cached = llm_cache.tokenize_paths(f"read {first}")
+
+    assert llm_cache.restore_paths(cached, f"at {second}") == f"read {second}"
+    assert llm_cache.restore_paths(cached, "no document here") is None
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import pdf_extractor
+from synthetic_pdf import write_pdf
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(pdf_extractor, "PDF_EXTRACTION_WORKERS", 2)
+    monkeypatch.setattr(pdf_extractor, "PDF_PARALLEL_MIN_PAGES", 0)
+    pdf_extractor.shutdown_pool()
+    yield
+    pdf_extractor.shutdown_pool()
+
+
+def serial(path):
+    return pdf_extractor.extract_pages(path, workers=1)
+
+
+def test_documents_of_any_size_share_one_pool(pool, tmp_path):
+    small = write_pdf(str(tmp_path / "small.pdf"), 20)
+    large = write_pdf(str(tmp_path / "large.pdf"), 70)
+    expected = {small: serial(small), large: serial(large)}
+
+    pools = set()
+    for path in (small, large, small, large):
+        assert pdf_extractor.extract_pages(path, workers=8) == expected[path]
+        pools.add(id(pdf_extractor._pool))
+
+    assert len(pools) == 1
+
+
+def test_concurrent_extractions_keep_their_pages_in_order(pool, tmp_path):
+    paths = [write_pdf(str(tmp_path / f"filing_{n}.pdf"), 40 + 10 * n, seed=n) for n in range(4)]
+    expected = [serial(path) for path in paths]
+
+    with ThreadPoolExecutor(max_workers=4) as threads:
+        results = list(threads.map(pdf_extractor.extract_pages, paths))
+
+    assert results == expected
@@ -0,0 +1,20 @@
+import pytest
+
+from result_store import accepts_encoding
+
+
+@pytest.mark.parametrize("header, accepted", [
+    ("zstd", True),
+    ("gzip, ZSTD;q=0.5", True),
+    ("*", True),
+    ("zstd;q=x", True),
+    ("gzip", False),
+    ("", False),
+    ("*;q=0", False),
+    ("zstd;q=0", False),
+    ("*, zstd;q=0", False),
+    ("zstd;q=0, *", False),
+    ("*;q=0, zstd", True),
+])
+def test_accepts_encoding(header, accepted):
+    assert accepts_encoding(header, "zstd") is accepted
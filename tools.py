@@ -1,10 +1,85 @@
+import hashlib
 import os
+import re
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
 load_dotenv()
 
 from crewai.tools import tool
-from langchain_community.document_loaders import PyPDFLoader
-from pypdf import PdfReader
+from extraction_cache import document_hash
+from keyword_scanner import document_scanner, FINANCIAL_TERMS, RISK_TERMS
+from metrics import stage_timer
+
+# pypdf, pandas and NumPy (pdf_extractor, financial_extraction, retrieval) are
+# imported inside the functions that use them, so importing the tools stays cheap
+
+_REPEATED_SPACES = re.compile(r"  +")
+_DIGIT = re.compile(r"\d")
+
+def _document_chunks(financial_document_data: str):
+    """Stream the pages of a pdf when given its path, otherwise the text itself"""
+    candidate = financial_document_data.strip()
+    if candidate.lower().endswith(".pdf") and os.path.exists(candidate):
+        from pdf_extractor import iter_document_pages
+        return iter_document_pages(candidate)
+    return [candidate]
+
+PROFILE_CACHE_SIZE = 8
+_profiles = OrderedDict()  # document key -> profile; holds no document text
+_profiles_lock = threading.Lock()
+
+def _document_profile(financial_document_data: str) -> dict:
+    """Scan the document once and share the result between the analysis tools"""
+    candidate = financial_document_data.strip()
+    if candidate.lower().endswith(".pdf") and os.path.exists(candidate):
+        key = document_hash(candidate)
+    else:
+        key = hashlib.sha256(candidate.encode()).hexdigest()
+    with _profiles_lock:
+        profile = _profiles.get(key)
+        if profile is not None:
+            _profiles.move_to_end(key)
+            return profile
+    profile = _profile(candidate)
+    with _profiles_lock:
+        _profiles[key] = profile
+        while len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+    return profile
+
+def _profile(financial_document_data: str) -> dict:
+    profile = {"data_length": 0, "contains_numbers": False, "data_available": False, "sample": ""}
+    
+    def chunks():
+        for index, chunk in enumerate(_document_chunks(financial_document_data)):
+            if index:
+                chunk = "\n" + chunk
+            # Length once runs of spaces are collapsed, without copying the chunk
+            runs = _REPEATED_SPACES.findall(chunk)
+            profile["data_length"] += len(chunk) - sum(map(len, runs)) + len(runs)
+            profile["contains_numbers"] = profile["contains_numbers"] or _DIGIT.search(chunk) is not None
+            profile["data_available"] = profile["data_available"] or (bool(chunk) and not chunk.isspace())
+            if len(profile["sample"]) <= 200:
+                profile["sample"] += _REPEATED_SPACES.sub(" ", chunk[:4096])[:201 - len(profile["sample"])]
+            yield chunk
+    
+    scan = document_scanner.scan(chunks())
+    profile["counts"] = scan["counts"]  # the match positions are not needed here
+    if profile["data_length"] > 200:
+        profile["sample"] = profile["sample"][:200] + "..."
+    return profile
+
+def document_context(path: str, query: str) -> str:
+    """Extract the structured financials and the sections relevant to `query` once,
+    so agents running in parallel share the same text instead of each reading the pdf"""
+    from pdf_extractor import iter_document_pages
+    from financial_extraction import extract_financials, format_financials
+    from retrieval import get_document_index, format_chunks
+    financials = format_financials(extract_financials(iter_document_pages(path)))
+    excerpts = format_chunks(get_document_index(path).search(query))
+    return f"{financials}\n\nRelevant excerpts:\n{excerpts or 'No text could be extracted from the document.'}"
+
 
 @tool
 def read_financial_document(path: str = 'data/sample.pdf') -> str:
@@ -22,54 +97,70 @@ def read_financial_document(path: str = 'data/sample.pdf') -> str:
         if not os.path.exists(path):
             return f"Error: File not found at path: {path}"
         
-        # Try using PyPDFLoader first
+        # Pages are streamed from the extraction cache or the sharded extractor
         try:
-            loader = PyPDFLoader(path)
-            documents = loader.load()
-            
-            full_report = ""
-            for doc in documents:
-                content = doc.page_content
-                
-                # Clean and format the document content
-                while "\n\n" in content:
-                    content = content.replace("\n\n", "\n")
-                
-                full_report += content + "\n"
-            
-            return full_report.strip()
-            
-        except Exception as e1:
-            # Fallback to PyPDF2 if PyPDFLoader fails
-            try:
-                full_report = ""
-                with open(path, 'rb') as file:
-                    pdf_reader = PdfReader(file)
-                    
-                    for page_num in range(len(pdf_reader.pages)):
-                        page = pdf_reader.pages[page_num]
-                        content = page.extract_text()
-                        
-                        # Clean and format the content
-                        while "\n\n" in content:
-                            content = content.replace("\n\n", "\n")
-                        
-                        full_report += content + "\n"
-                
-                return full_report.strip()
-                
-            except Exception as e2:
-                return f"Error reading PDF file: {str(e2)}"
+            from pdf_extractor import iter_document_pages
+            with stage_timer("pdf_extraction"):
+                return "\n".join(iter_document_pages(path)).strip()
+        except Exception as e:
+            return f"Error reading PDF file: {str(e)}"
                 
     except Exception as e:
         return f"Error processing file: {str(e)}"
 
+@tool
+def search_financial_document(path: str = 'data/sample.pdf', query: str = '') -> str:
+    """Tool to retrieve the sections of a pdf file most relevant to a query
+    
+    Args:
+        path (str, optional): Path of the pdf file. Defaults to 'data/sample.pdf'.
+        query (str): What to look for, e.g. the user's question or a topic such as "liquidity and debt".
+        
+    Returns:
+        str: The best matching sections, labelled with their page numbers, within the configured token budget
+    """
+    
+    try:
+        if not os.path.exists(path):
+            return f"Error: File not found at path: {path}"
+        
+        from retrieval import get_document_index, format_chunks
+        chunks = get_document_index(path).search(query)
+        if not chunks:
+            return "No text could be extracted from the document."
+        return format_chunks(chunks)
+        
+    except Exception as e:
+        return f"Error searching document: {str(e)}"
+
+@tool
+def extract_financial_metrics(path: str = 'data/sample.pdf') -> str:
+    """Tool to extract financial line items and ratios from a pdf file as a compact table
+    
+    Args:
+        path (str, optional): Path of the pdf file. Defaults to 'data/sample.pdf'.
+        
+    Returns:
+        str: Line items (revenue, net income, total assets, ...) per period and the ratios computed from them
+    """
+    
+    try:
+        if not os.path.exists(path):
+            return f"Error: File not found at path: {path}"
+        
+        from pdf_extractor import iter_document_pages
+        from financial_extraction import extract_financials, format_financials
+        return format_financials(extract_financials(iter_document_pages(path)))
+        
+    except Exception as e:
+        return f"Error extracting financial metrics: {str(e)}"
+
 @tool
 def analyze_investment(financial_document_data: str) -> str:
     """Analyze investment opportunities from financial document data
     
     Args:
-        financial_document_data (str): The financial document content
+        financial_document_data (str): The financial document content, or the path of the pdf file
         
     Returns:
         str: Investment analysis results
@@ -79,21 +170,16 @@ def analyze_investment(financial_document_data: str) -> str:
         return "No financial data provided for investment analysis"
     
     try:
-        # Process and clean the data
-        processed_data = financial_document_data.strip()
-        
-        # Remove excessive whitespace
-        while "  " in processed_data:
-            processed_data = processed_data.replace("  ", " ")
+        profile = _document_profile(financial_document_data)
+        counts = profile["counts"]
         
         # Basic analysis 
         analysis_results = {
-            "data_length": len(processed_data),
-            "contains_numbers": any(char.isdigit() for char in processed_data),
-            "contains_financial_keywords": any(keyword in processed_data.lower() 
-                for keyword in ["revenue", "profit", "loss", "assets", "liabilities", 
-                              "cash flow", "balance sheet", "income statement"]),
-            "processed_data_sample": processed_data[:200] + "..." if len(processed_data) > 200 else processed_data
+            "data_length": profile["data_length"],
+            "contains_numbers": profile["contains_numbers"],
+            "contains_financial_keywords": any(counts[keyword] for keyword in FINANCIAL_TERMS),
+            "financial_keyword_counts": {keyword: counts[keyword] for keyword in FINANCIAL_TERMS if counts[keyword]},
+            "processed_data_sample": profile["sample"]
         }
         
         return f"Investment Analysis Results: {analysis_results}"
@@ -106,7 +192,7 @@ def assess_risk(financial_document_data: str) -> str:
     """Create risk assessment from financial document data
     
     Args:
-        financial_document_data (str): The financial document content
+        financial_document_data (str): The financial document content, or the path of the pdf file
         
     Returns:
         str: Risk assessment results
@@ -116,20 +202,21 @@ def assess_risk(financial_document_data: str) -> str:
         return "No financial data provided for risk assessment"
     
     try:
-        # Process the financial data
-        processed_data = financial_document_data.strip()
+        profile = _document_profile(financial_document_data)
+        counts = profile["counts"]
+        risk_keywords = ["risk", "uncertainty", "volatile", "fluctuation"]
         
         # Basic risk indicators
         risk_indicators = {
-            "data_available": bool(processed_data),
-            "debt_mentioned": "debt" in processed_data.lower() or "liability" in processed_data.lower(),
-            "loss_mentioned": "loss" in processed_data.lower() or "deficit" in processed_data.lower(),
-            "cash_flow_mentioned": "cash flow" in processed_data.lower(),
-            "risk_keywords_found": [keyword for keyword in ["risk", "uncertainty", "volatile", "fluctuation"]
-                                  if keyword in processed_data.lower()]
+            "data_available": profile["data_available"],
+            "debt_mentioned": bool(counts["debt"] or counts["liability"]),
+            "loss_mentioned": bool(counts["loss"] or counts["deficit"]),
+            "cash_flow_mentioned": bool(counts["cash flow"]),
+            "risk_keywords_found": [keyword for keyword in risk_keywords if counts[keyword]],
+            "risk_keyword_counts": {keyword: counts[keyword] for keyword in RISK_TERMS if counts[keyword]}
         }
         
         return f"Risk Assessment Results: {risk_indicators}"
         
     except Exception as e:
-        return f"Error in risk assessment: {str(e)}"
\ No newline at end of file
+        return f"Error in risk assessment: {str(e)}"
@@ -0,0 +1,96 @@
+import os
+from contextlib import nullcontext
+
+# Optional OpenTelemetry tracing. Spans are exported over OTLP/HTTP when
+# TRACING_ENABLED is set (or an OTLP endpoint is configured) and the packages are
+# installed; otherwise every helper here is a no-op. The API injects the trace
+# context into Celery message headers so the task span joins the request's trace.
+TRACING_ENABLED = os.getenv(
+    "TRACING_ENABLED", "true" if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") else "false"
+).lower() in ("1", "true", "yes")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "financial-document-analyzer")
+TRACE_HEADERS = ("traceparent", "tracestate")
+
+_tracer = None
+_task_spans = {}  # celery task id -> (span, context token)
+
+
+def setup_tracing(service: str = SERVICE_NAME):
+    """Install the tracer provider once per process; returns False when tracing is off"""
+    global _tracer
+    if _tracer is not None:
+        return True
+    if not TRACING_ENABLED:
+        return False
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer(__name__)
+    return True
+
+
+def instrument_app(app):
+    """Trace FastAPI requests"""
+    if not setup_tracing(f"{SERVICE_NAME}-api"):
+        return
+    try:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    except ImportError:
+        return
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics")
+
+
+def span(name: str, **attributes):
+    """A child span of the current one, or a no-op context when tracing is off"""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes=attributes or None)
+
+
+def inject_headers() -> dict:
+    """Headers carrying the current trace context, for Celery messages"""
+    if _tracer is None:
+        return {}
+    from opentelemetry.propagate import inject
+    carrier = {}
+    inject(carrier)
+    return carrier
+
+
+def start_task_span(task_id: str, name: str, request):
+    """Open the span of a Celery task as a child of the trace in its message headers"""
+    if _tracer is None:
+        return
+    from opentelemetry import context, trace
+    from opentelemetry.propagate import extract
+
+    # Custom message headers show up on the request itself or in request.headers
+    carrier = dict(getattr(request, "headers", None) or {})
+    for header in TRACE_HEADERS:
+        value = getattr(request, header, None)
+        if value and header not in carrier:
+            carrier[header] = value
+    task_span = _tracer.start_span(name, context=extract(carrier), kind=trace.SpanKind.CONSUMER,
+                                   attributes={"celery.task_id": task_id})
+    _task_spans[task_id] = (task_span, context.attach(trace.set_span_in_context(task_span)))
+
+
+def end_task_span(task_id: str, state: str = None):
+    entry = _task_spans.pop(task_id, None)
+    if entry is None:
+        return
+    from opentelemetry import context
+    task_span, token = entry
+    if state:
+        task_span.set_attribute("celery.state", state)
+    context.detach(token)
+    task_span.end()
@@ -0,0 +1,105 @@
+import hashlib
+import os
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "data")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(2 * 1024 * 1024 * 1024)))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "500"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Allowance for multipart boundaries and the other form fields around the file
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+def upload_path(file_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"financial_document_{file_id}.pdf")
+
+
+async def save_upload(file: UploadFile, destination: str, max_bytes: int = MAX_UPLOAD_BYTES):
+    """Stream an upload to `destination` chunk by chunk
+
+    Hashes the content on the fly and raises a 413 as soon as it grows past
+    `max_bytes`. Disk writes run in the threadpool so the event loop is never
+    blocked, and the file is written under a temporary name and renamed into
+    place so a partial upload is never visible at `destination`.
+
+    Returns (size in bytes, hex SHA-256).
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    tmp_path = f"{destination}.part"
+    digest = hashlib.sha256()
+    size = 0
+
+    f = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+            digest.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(os.replace, tmp_path, destination)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return size, digest.hexdigest()
+
+
+def upload_limit(path: str):
+    """(byte limit, what it applies to) for a POST to `path`"""
+    if path == "/analyze/batch":
+        return MAX_BATCH_UPLOAD_BYTES, "Batch"
+    return MAX_UPLOAD_BYTES, "File"
+
+
+class UploadLimitMiddleware:
+    """Reject POST bodies over the upload limit before they are parsed and spooled
+
+    A Content-Length over the limit is refused without reading the body. Bodies
+    sent without one (chunked transfer) are counted as they arrive, and reading
+    stops with a 413 as soon as they pass the limit.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        limit, subject = upload_limit(scope["path"])
+        max_body = limit + FORM_OVERHEAD_BYTES
+        detail = f"{subject} exceeds the {limit} byte upload limit"
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > max_body:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    # Raised inside body parsing, so FastAPI answers it as a 413
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)